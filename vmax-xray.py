@@ -2,24 +2,170 @@
 # coding: utf-8
 
 import argparse
+import json
 import logging
+import os
 import sys
+import time
 from vmaxray.parser import ConfigFileParser
 from vmaxray.PyU4V import RestFunctions
 from vmaxray.vmax_inventory import VmaxInventoryFactory
-from vmaxray.formatters import XlsFormatter
+from vmaxray.formatters import *
+from vmaxray.columnar import ColumnarFormatter
+from vmaxray.hotspots import HotObjectsReport
+from vmaxray.perf_archive import PerfArchive
+from vmaxray.inventory_diff import InventoryDiff
+from vmaxray.snapshot_archive import SnapshotArchive
+from vmaxray.capacity import CapacityHistory, CapacityHistoryFormatter
+from vmaxray.wwn_index import WwnIndex, WwnIndexWriter
+from vmaxray.audit import AuditFormatter
+from vmaxray.journal import InventoryJournal
+from vmaxray.estimate import InventoryEstimator, total, describe
+from vmaxray.scheduler import FleetScheduler, RunStatistics
+from vmaxray.scope import Scope, parse_ranges, parse_sections
 from vmaxray.errors import *
 
 __author__ = 'Julien B.'
 
 msg = 'Vmax-XRay - Tool for Inventory a VMAX'
 
+# Inventory formats: formatter class, file extension (None for the
+# streaming formats, that write a directory with one file per section)
+formats = {'xls': (XlsFormatter, 'xlsx'),
+           'sqlite': (SqliteFormatter, 'db'),
+           'csv': (CsvFormatter, None),
+           'jsonl': (JsonLinesFormatter, None)}
+
 parser = argparse.ArgumentParser(description=msg)
-parser.add_argument('config', action='store', type=str, help='config file')
+parser.add_argument('config', action='store', type=str, nargs='?',
+                    help='config file')
 parser.add_argument('-p', '--path', action='store', dest='path', type=str,
                     help='path to store the inventory file')
+parser.add_argument('-f', '--format', action='store', dest='format',
+                    choices=sorted(formats), default='xls',
+                    help='format of the inventory file (default: xls)')
+parser.add_argument('-z', '--gzip', action='store_true', default=False,
+                    help='compress the csv and jsonl files')
+parser.add_argument('--single-stream', action='store_true', default=False,
+                    dest='single_stream',
+                    help='write all the jsonl sections into one tagged '
+                         'stream instead of one file per section')
+parser.add_argument('--parallel', action='store', dest='parallel', type=int,
+                    metavar='K', default=0,
+                    help='inventory several arrays at once, at most K per '
+                         'UNISPHERE server, the biggest ones first (by '
+                         'their number of objects, recorded in '
+                         'vmax-xray-stats.json in PATH)')
+parser.add_argument('--workers', action='store', dest='workers', type=int,
+                    metavar='N',
+                    help='inventory at most N arrays at once with '
+                         '--parallel (default: K per UNISPHERE server)')
+parser.add_argument('--pipeline', action='store', dest='pipeline', type=int,
+                    metavar='SIZE', default=0,
+                    help='write the inventory while the objects are '
+                         'requested, through a queue of SIZE objects')
+parser.add_argument('--serve', action='store', dest='serve', type=str,
+                    metavar='[HOST:]PORT',
+                    help='run as a daemon keeping the inventories in '
+                         'memory, served by a JSON API on HOST:PORT '
+                         '(default host: 127.0.0.1)')
+parser.add_argument('--refresh', action='store', dest='refresh', type=int,
+                    metavar='MINUTES', default=60,
+                    help='minutes between two refreshes of the inventories '
+                         'of the daemon (default: 60)')
+parser.add_argument('--estimate', action='store_true', default=False,
+                    help='estimate the requests, data volume and time of '
+                         'the inventories instead of running them, and '
+                         'write them as JSON Lines on the standard output')
+parser.add_argument('--shards', action='store', dest='shards', type=int,
+                    metavar='N', default=0,
+                    help='request the TDEVs through N connections to '
+                         'UNISPHERE at once')
+parser.add_argument('--prefetch', action='store', dest='prefetch', type=int,
+                    metavar='N', default=0,
+                    help='keep N requests in flight per connection to '
+                         'UNISPHERE (default: 0, one request at a time)')
+parser.add_argument('--resume', action='store_true', default=False,
+                    help='resume the interrupted inventories from their '
+                         'journal instead of starting them again')
+parser.add_argument('--sections', action='store', dest='sections',
+                    type=str, metavar='SECTION[,SECTION...]',
+                    help='inventory only these sections (volume, '
+                         'storage_group, srp...)')
+parser.add_argument('--scope-sg', action='append', dest='scope_sg',
+                    metavar='PATTERN',
+                    help='inventory only the storage groups whose name '
+                         'contains PATTERN, and their volumes (repeatable)')
+parser.add_argument('--scope-srp', action='store', dest='scope_srp',
+                    metavar='SRP',
+                    help='inventory only the storage groups of SRP, and '
+                         'their volumes')
+parser.add_argument('--scope-volumes', action='store', dest='scope_volumes',
+                    metavar='RANGES',
+                    help='inventory only the volumes in these ID ranges '
+                         '(00100-001FF,00300)')
+parser.add_argument('--mapped-only', action='store_true', default=False,
+                    dest='mapped_only',
+                    help='inventory only the mapped volumes')
+parser.add_argument('-c', '--columnar', action='store_true', default=False,
+                    help='also write a columnar snapshot of the TDEVs')
+parser.add_argument('-a', '--archive', action='store', dest='archive',
+                    type=str,
+                    help='also store the inventory as a daily snapshot of '
+                         'that deduplicated archive')
+parser.add_argument('--history', action='store', dest='history', type=str,
+                    help='also record the SRP and SG capacities into that '
+                         'capacity history database')
+parser.add_argument('--forecast', action='store', dest='forecast',
+                    type=float, metavar='THRESHOLD',
+                    help='add the capacity forecast of the array to its '
+                         'inventory, with the date each SRP reaches that '
+                         'percentage of its usable capacity (requires '
+                         '--history)')
+parser.add_argument('-r', '--render', action='store', dest='render',
+                    type=str, metavar='ARCHIVE',
+                    help='write the inventories from the snapshots of that '
+                         'archive instead of collecting them from the arrays '
+                         '(all the arrays of the archive without config '
+                         'file)')
+parser.add_argument('--date', action='store', dest='date', type=str,
+                    help='date (YYYY-MM-DD) of the rendered snapshots '
+                         '(default: the latest one)')
+parser.add_argument('--audit', action='store_true', default=False,
+                    help='add the orphan and misconfigured objects of the '
+                         'array to its inventory')
+parser.add_argument('-i', '--index', action='store', dest='index',
+                    type=str,
+                    help='also write the WWN index of the inventoried (or '
+                         'rendered) arrays into that file')
+parser.add_argument('-l', '--lookup', action='store', nargs='+',
+                    dest='lookup', metavar=('INDEX', 'WWN'),
+                    help='look up WWNs (volumes or initiators) in a WWN '
+                         'index and write the matches as JSON Lines on the '
+                         'standard output')
 parser.add_argument('-d', '--debug', action='store_true', default=False,
                     help='enable the debug mode')
+parser.add_argument('--diff', action='store', nargs=2, dest='diff',
+                    metavar=('OLD', 'NEW'),
+                    help='compare two jsonl inventories and write the '
+                         'changes as JSON Lines on the standard output')
+parser.add_argument('-t', '--top', action='store', dest='top', type=int,
+                    help='report the TOP hottest objects instead of '
+                         'making an inventory')
+parser.add_argument('--top-scope', action='store', dest='top_scope',
+                    choices=['sg', 'host'], default='sg',
+                    help='objects ranked by the top report (default: sg)')
+parser.add_argument('--top-metric', action='append', dest='top_metrics',
+                    help='metric ranked by the top report, can be repeated '
+                         '(default: ResponseTime)')
+parser.add_argument('--top-window', action='store', dest='top_window',
+                    type=int, default=60,
+                    help='minutes of data used by the top report '
+                         '(default: 60)')
+parser.add_argument('--perf-archive', action='store', dest='perf_archive',
+                    type=str, metavar='DIR',
+                    help='also append the performance data fetched by the '
+                         'top report to the archive DIR/<SID>')
 
 args = parser.parse_args()
 
@@ -30,39 +176,340 @@ logger.setLevel(logging.DEBUG) if args.debug else logger.setLevel(logging.INFO)
 
 
 def main():
+    if args.diff:
+        try:
+            InventoryDiff(*args.diff).report(sys.stdout)
+        except InventoryDiffError:
+            sys.exit(4)
+        return
+
+    if args.lookup:
+        lookup()
+        return
+
+    if args.render:
+        render()
+        return
+
+    if not args.config:
+        parser.error('the config file is required')
+
+    if args.forecast and not args.history:
+        parser.error('--forecast requires --history')
+
+    if args.perf_archive and not args.top:
+        parser.error('--perf-archive requires --top')
+
     try:
         config = ConfigFileParser(file=args.config)
     except ConfigurationError as error:
         logger.error('Error while parsing configuration: %s' % error)
         sys.exit(1)
 
-    for array, address, user, password in config.get_arrays():
-        vmax = RestFunctions(username=user, password=password,
-                             server_ip=address, u4v_version='84')
-        vmax.array_id = array
+    try:
+        # Options of the command line, overriding the config file
+        scope = Scope(sections=(parse_sections(args.sections)
+                                if args.sections else None),
+                      storage_groups=args.scope_sg,
+                      srp=args.scope_srp,
+                      volumes=parse_ranges(args.scope_volumes or ''),
+                      mapped=args.mapped_only)
+    except ConfigurationError as error:
+        parser.error(str(error))
 
-        # The only supported version is U4V 8.4
-        # Work in progress
-        version = vmax.get_uni_version()
-        if not version[0]['version'].startswith('V8.4'):
-            logger.error('UNISPHERE 8.4 is the only supported version')
-            sys.exit(1)
+    if args.refresh < 1:
+        parser.error('--refresh must be at least 1 minute')
+
+    if args.parallel < 0:
+        parser.error('--parallel must be positive')
+
+    if args.prefetch < 0:
+        parser.error('--prefetch must be positive')
+
+    if args.workers is not None and not args.parallel:
+        parser.error('--workers requires --parallel')
+
+    if args.workers is not None and args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    if args.serve:
+        serve(config, scope)
+        return
+
+    try:
+        archive = SnapshotArchive(args.archive) if args.archive else None
+    except SnapshotArchiveError:
+        sys.exit(2)
+
+    try:
+        history = CapacityHistory(args.history) if args.history else None
+        index = WwnIndexWriter(args.index) if args.index else None
+    except (CapacityHistoryError, WwnIndexError):
+        if archive:
+            archive.close()
+        sys.exit(2)
+
+    path = args.path if args.path else '.'
+    # Sizes of the arrays, for the scheduling of the next --parallel runs
+    statistics = (RunStatistics(os.path.join(path, 'vmax-xray-stats.json'))
+                  if args.parallel else None)
+    estimates = []
+
+    def inventory(array: str, address: str, user: str, password: str):
+        vmax = connect(array, address, user, password)
 
-        path = args.path if args.path else '.'
+        if args.top:
+            report_top(vmax)
+            return
+
+        if args.estimate:
+            estimates.append(
+                estimate(vmax, config.get_scope(array).merge(scope)))
+            return
 
         try:
-            filename = 'Vmax-%s.xlsx' % array
-            formatter = XlsFormatter(path=path, filename=filename)
+            formatter = build_formatter(array, path, index)
+            if archive:
+                formatter = TeeFormatter(formatter, archive.writer(array))
+            if history:
+                # Closed first: the forecast is added to the inventory
+                capacity = CapacityHistoryFormatter(
+                    history, array,
+                    forecast=formatter if args.forecast else None,
+                    threshold=args.forecast)
+                formatter = TeeFormatter(capacity, formatter)
+
+            # Checkpoints of the collection, removed once it is complete
+            array_scope = config.get_scope(array).merge(scope)
+            journal = InventoryJournal(
+                os.path.join(path, 'Vmax-%s.journal' % array), array,
+                resume=args.resume, scope=array_scope)
 
+            start = time.time()
             collector = VmaxInventoryFactory(sid=array)
-            collector.collect(formatter=formatter, array=vmax)
+            collector.collect(formatter=formatter, array=vmax,
+                              pipeline=args.pipeline, journal=journal,
+                              scope=array_scope, shards=args.shards,
+                              prefetch=args.prefetch)
+            journal.remove()
+            if statistics:
+                statistics.record(array, sum(collector.counts.values()),
+                                  time.time() - start)
             del formatter
 
-        except XlsFormatterError:
+        except (XlsFormatterError, SqliteFormatterError,
+                StreamFormatterError, ColumnarFormatterError,
+                InventoryJournalError):
             sys.exit(2)
         except VmaxInventoryFactoryError:
             sys.exit(3)
 
+    arrays = list(config.get_arrays())
+    scheduler = None
+    try:
+        if args.parallel:
+            scheduler = FleetScheduler(budget=args.parallel,
+                                       workers=args.workers,
+                                       sizes=statistics.objects())
+            scheduler.run(arrays, inventory)
+        else:
+            for array in arrays:
+                inventory(*array)
+    finally:
+        # The snapshots already stored stay in the archive
+        if archive:
+            archive.close()
+
+    if history:
+        history.close()
+    if index:
+        index.close()
+    if estimates:
+        # Time of the whole run, at the concurrency of --parallel
+        fleet = total(estimates, scheduler=scheduler,
+                      addresses={array: address for array, address, user,
+                                 password in arrays})
+        logger.info(describe(fleet))
+        sys.stdout.write(json.dumps(fleet) + '\n')
+
+
+def connect(array: str, address: str, user: str, password: str):
+    """ Create the connection to an array """
+    vmax = RestFunctions(username=user, password=password,
+                         server_ip=address, u4v_version='84')
+    vmax.array_id = array
+
+    # The only supported version is U4V 8.4
+    # Work in progress
+    version = vmax.get_uni_version()
+    if not version[0]['version'].startswith('V8.4'):
+        logger.error('UNISPHERE 8.4 is the only supported version')
+        sys.exit(1)
+    return vmax
+
+
+def serve(config: ConfigFileParser, scope: Scope):
+    """ Keep the inventories in memory and serve them over HTTP """
+    from vmaxray.daemon import InventoryCache, InventoryServer
+
+    host, _, port = args.serve.rpartition(':')
+    try:
+        listen = (host or '127.0.0.1', int(port))
+    except ValueError:
+        parser.error('invalid address %s' % args.serve)
+
+    arrays = [(connect(array, address, user, password),
+               config.get_scope(array).merge(scope))
+              for array, address, user, password in config.get_arrays()]
+    cache = InventoryCache(arrays, interval=args.refresh * 60,
+                           shards=args.shards, prefetch=args.prefetch)
+    try:
+        server = InventoryServer(listen, cache)
+    except OSError as error:
+        logger.error('Unable to listen on %s (%s)' % (args.serve, error))
+        sys.exit(2)
+
+    cache.start()
+    logger.info('Serving the inventories on http://%s:%d/' % listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    cache.stop()
+    server.server_close()
+
+
+def estimate(vmax: RestFunctions, scope: Scope):
+    """ Estimate the cost of the inventory of an array """
+    estimator = InventoryEstimator(vmax, scope=scope, connections=args.shards,
+                                   prefetch=args.prefetch)
+    try:
+        result = estimator.estimate()
+    except VmaxIteratorError:
+        sys.exit(3)
+
+    for section, values in result['sections'].items():
+        logger.info('- %-24s %8d objects, %6.1f ms per request' %
+                    (section, values['objects'], values['latency'] * 1000))
+    logger.info(describe(result))
+    sys.stdout.write(json.dumps(result) + '\n')
+    return result
+
+
+def render():
+    """ Write the inventories of the arrays from an archive """
+    try:
+        archive = SnapshotArchive(args.render)
+        index = WwnIndexWriter(args.index) if args.index else None
+    except (SnapshotArchiveError, WwnIndexError):
+        sys.exit(2)
+
+    if args.config:
+        try:
+            config = ConfigFileParser(file=args.config)
+        except ConfigurationError as error:
+            logger.error('Error while parsing configuration: %s' % error)
+            sys.exit(1)
+        arrays = [array for array, address, user, password
+                  in config.get_arrays()]
+    else:
+        arrays = archive.arrays()
+
+    path = args.path if args.path else '.'
+    for array in arrays:
+        dates = archive.dates(array)
+        date = args.date if args.date else (dates[-1] if dates else None)
+        if date not in dates:
+            logger.error('No snapshot of %s at %s in the archive' %
+                         (array, date or 'any date'))
+            continue
+
+        logger.info('Rendering the snapshot of %s (%s)' % (array, date))
+        try:
+            archive.replay(array, build_formatter(array, path, index), date)
+        except (XlsFormatterError, SqliteFormatterError,
+                StreamFormatterError, ColumnarFormatterError):
+            sys.exit(2)
+
+    archive.close()
+    if index:
+        index.close()
+
+
+def lookup():
+    """ Write the entries of WWNs found in an index """
+    if len(args.lookup) < 2:
+        parser.error('--lookup requires an index and at least one WWN')
+
+    try:
+        index = WwnIndex(args.lookup[0])
+    except WwnIndexError:
+        sys.exit(2)
+
+    for wwn in args.lookup[1:]:
+        entries = index.lookup(wwn)
+        if not entries:
+            logger.info('%s not found' % wwn)
+        for entry in entries:
+            sys.stdout.write(json.dumps(dict(entry, wwn=wwn)) + '\n')
+    index.close()
+
+
+def build_formatter(array: str, path: str, index: WwnIndexWriter = None):
+    """ Create the formatter of the inventory of an array """
+    formatter_class, extension = formats[args.format]
+    if extension:
+        filename = 'Vmax-%s.%s' % (array, extension)
+        formatter = formatter_class(path=path, filename=filename)
+    elif args.format == 'jsonl' and args.single_stream:
+        formatter = formatter_class(path=path,
+                                    filename='Vmax-%s.jsonl' % array,
+                                    split=False, compress=args.gzip)
+    else:
+        formatter = formatter_class(path=path, filename='Vmax-%s' % array,
+                                    compress=args.gzip)
+
+    if args.columnar:
+        snapshot = ColumnarFormatter(path=path,
+                                     filename='Vmax-%s.tdev' % array)
+        formatter = TeeFormatter(formatter, snapshot)
+    if index:
+        formatter = TeeFormatter(formatter, index.formatter(array))
+    if args.audit:
+        # Closed first: the findings are added to the inventory
+        formatter = TeeFormatter(AuditFormatter(array, formatter), formatter)
+    return formatter
+
+
+def report_top(vmax: RestFunctions):
+    """ Log the hottest storage groups or hosts of an array """
+    metrics = args.top_metrics if args.top_metrics else ['ResponseTime']
+    end_date = int(round(time.time() * 1000))
+    start_date = end_date - args.top_window * 60000
+
+    archive = None
+    try:
+        if args.perf_archive:
+            archive = PerfArchive(os.path.join(args.perf_archive,
+                                               vmax.array_id), mode='a')
+        report = HotObjectsReport(vmax, scope=args.top_scope)
+        top = report.rank(start_date, end_date, metrics, count=args.top,
+                          archive=archive)
+    except PerfArchiveError:
+        sys.exit(2)
+    except VmaxIteratorError:
+        sys.exit(3)
+    finally:
+        if archive:
+            archive.close()
+
+    for metric in metrics:
+        logger.info('Top %d %s by %s (%s, last %d minutes)' %
+                    (args.top, args.top_scope, metric, vmax,
+                     args.top_window))
+        for rank, (name, value) in enumerate(top.top(metric), start=1):
+            logger.info('%3d. %-40s %12.2f' % (rank, name, value))
+
 
 if __name__ == '__main__':
     main()
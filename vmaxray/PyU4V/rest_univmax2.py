@@ -19,8 +19,10 @@
 # CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+import copy
 import csv
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import ConfigParser as Config
@@ -55,6 +57,48 @@ CREATED = 'created'
 SUCCEEDED = 'succeeded'
 CREATE_VOL_STRING = 'Creating new Volumes'
 ASYNCHRONOUS = "ASYNCHRONOUS"
+# Performance constants
+PERF_WORKERS = 8
+DIRECTOR_METRICS = {
+    'BE': ('BEDirector', [
+        'AvgTimePerSyscall', 'CompressedMBs', 'CompressedReadMBs',
+        'CompressedWriteMBs', 'CompressedReadReqs', 'CompressedReqs',
+        'CompressedWriteReqs', 'IOs', 'MBs', 'MBRead', 'MBWritten',
+        'PercentBusy', 'PercentBusyLogicalCore_0',
+        'PercentBusyLogicalCore_1', 'PercentNonIOBusyLogicalCore_1',
+        'PercentNonIOBusyLogicalCore_0', 'PercentNonIOBusy',
+        'PrefetchedTracks', 'ReadReqs', 'Reqs', 'SyscallCount',
+        'Syscall_RDF_DirCount', 'SyscallRemoteDirCount', 'WriteReqs'
+    ]),
+    'FE': ('FEDirector', [
+        'AvgRDFSWriteResponseTime', 'AvgReadMissResponseTime',
+        'AvgWPDiscTime', 'AvgTimePerSyscall', 'DeviceWPEvents',
+        'HostMBs', 'HitReqs', 'HostIOs', 'MissReqs',
+        'AvgOptimizedReadMissSize', 'OptimizedMBReadMisses',
+        'OptimizedReadMisses', 'WriteMissReqs', 'PercentHitReqs',
+        'PercentReadReqs', 'PercentReadReqHit', 'PercentWriteReqs',
+        'PercentWriteReqHit', 'QueueDepthUtilization', 'ReadMissReqs',
+        'HostIOLimitMBs', 'ReadReqs', 'ReadHitReqs', 'Reqs',
+        'ReadResponseTime', 'HostIOLimitIOs', 'WriteResponseTime',
+        'SlotCollisions', 'SyscallCount', 'Syscall_RDF_DirCounts',
+        'SyscallRemoteDirCounts', 'SystemWPEvents', 'TotalReadCount',
+        'TotalWriteCount', 'WriteReqs', 'WriteHitReqs', 'PercentBusy',
+    ]),
+    'RDF': ('RDFDirector', [
+        'AvgIOServiceTime', 'AvgIOSizeReceived', 'AvgIOSizeSent',
+        'AvgTimePerSyscall', 'CopyIOs', 'CopyMBs', 'IOs', 'Reqs',
+        'MBSentAndReceived', 'MBRead', 'MBWritten', 'PercentBusy',
+        'Rewrites', 'AsyncMBSent', 'AsyncWriteReqs', 'SyncMBSent',
+        'SyncWrites', 'SyscallCount', 'Syscall_RDF_DirCounts',
+        'SyscallRemoteDirCount', 'SyscallTime', 'WriteReqs',
+        'TracksSentPerSec', 'TracksReceivedPerSec'
+    ]),
+    'IM': ('IMDirector', ['PercentBusy']),
+    'EDS': ('EDSDirector', [
+        'PercentBusy', 'RandomReadMissMBs', 'RandomReadMisses',
+        'RandomWriteMissMBs', 'RandomWriteMisses'
+    ]),
+}
 
 
 class RestFunctions:
@@ -79,6 +123,20 @@ class RestFunctions:
         """
         self.rest_client.close_session()
 
+    def clone(self):
+        """Create another connection to the same server and array.
+
+        The clone has its own rest session, so both can send requests
+        concurrently.
+        :returns: RestFunctions
+        """
+        clone = copy.copy(self)
+        clone.rest_client = RestRequests(
+            self.rest_client.username, self.rest_client.password,
+            self.rest_client.verifySSL, self.rest_client.base_url)
+        clone.request = clone.rest_client.rest_request
+        return clone
+
     def wait_for_job_complete(self, job):
         """Given the job wait for it to complete.
 
@@ -261,6 +319,18 @@ class RestFunctions:
                                      resource_name)
         return self._get_request(target_uri, resource_type, params)
 
+    def get_iterator_page(self, iterator_id, start, end):
+        """Get a page of the results of a paginated list.
+
+        :param iterator_id: the id of the iterator returned with the list
+        :param start: position of the first result of the page (from 1)
+        :param end: position of the last result of the page
+        :returns: page -- dict or None, status_code
+        """
+        target_uri = '/common/Iterator/%s/page' % iterator_id
+        return self._get_request(target_uri, 'iterator page',
+                                 {'from': start, 'to': end})
+
     def create_resource(self, array, category, resource_type, payload,
                         version=None):
         """Create a provisioning resource.
@@ -2416,25 +2486,50 @@ class RestFunctions:
             dir_list.append(director['directorId'])
         return dir_list
 
-    def get_fe_port_list(self):
+    def _run_concurrently(self, function, arguments, workers=PERF_WORKERS):
+        """Call a function once per argument tuple using a thread pool.
+
+        :param function: the callable to execute
+        :param arguments: list of argument tuples, one per call
+        :param workers: maximum number of concurrent requests
+        :return: list of results, in the same order as arguments
+        """
+        arguments = list(arguments)
+        if not arguments:
+            return []
+        workers = max(1, min(workers, len(arguments)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda args: function(*args), arguments))
+
+    def get_fe_director_port_list(self, director):
+        """Get the list of front end ports of a single FE Director.
+
+        :param director: the director ID e.g. FA-1D
+        :return: list of port IDs
+        """
+        target_uri = "/performance/FEPort/keys"
+        port_payload = ({
+            "symmetrixId": self.array_id,
+            "directorId": director
+        })
+        port_response = self.rest_client.rest_request(
+            target_uri, POST, request_object=port_payload)
+        return [port['portId'] for port in port_response[0]['fePortInfo']]
+
+    def get_fe_port_list(self, workers=PERF_WORKERS):
         """Function to get a list of all front end ports in the array.
 
+        Ports of every director are requested concurrently.
+        :param workers: maximum number of concurrent requests
         :return: List of Directors and Ports
         """
-        target_uri = "/performance/FEPort/keys"
-        port_list = []
         dir_list = self.get_fe_director_list()
-        for director in dir_list:
-            port_payload = ({
-                "symmetrixId": self.array_id,
-                "directorId": director
-            })
-            port_details = {}
-            port_response = self.rest_client.rest_request(
-                target_uri, POST, request_object=port_payload)
-            for port in port_response[0]['fePortInfo']:
-                port_details[port['portId']] = director
-            port_list.append(port_details)
+        responses = self._run_concurrently(
+            self.get_fe_director_port_list,
+            [(director,) for director in dir_list], workers)
+        port_list = []
+        for director, ports in zip(dir_list, responses):
+            port_list.append({port: director for port in ports})
         return port_list
 
     def get_fe_port_util_last4hrs(self, dir_id, port_id):
@@ -2457,6 +2552,96 @@ class RestFunctions:
         return self.rest_client.rest_request(
             target_uri, POST, request_object=port_perf_payload)
 
+    def get_fe_port_util_sweep(self, start_date=None, end_date=None,
+                               metrics=('PercentBusy',),
+                               dataformat='Average', workers=PERF_WORKERS):
+        """Get metrics of every front end port of the array.
+
+        Directors, ports and port metrics are all requested concurrently.
+        The result is a port x time matrix per metric: row i of
+        data[metric] holds the values of ports[i], column j the value at
+        timestamps[j] (None when the port did not report that sample).
+        Defaults to the last 4 hours.
+        :param start_date: Date EPOCH Time in Milliseconds, optional
+        :param end_date: Date EPOCH Time in Milliseconds, optional
+        :param metrics: list of FE port metrics e.g. PercentBusy, IOs, MBs
+        :param dataformat: Average or Maximum
+        :param workers: maximum number of concurrent requests
+        :return: sweep_results_combined
+        """
+        if end_date is None:
+            end_date = int(round(time.time() * 1000))
+        if start_date is None:
+            start_date = (end_date - 14400000)
+        metrics = list(metrics)
+
+        ports = []
+        for port_details in self.get_fe_port_list(workers=workers):
+            for port_id, director_id in sorted(port_details.items()):
+                ports.append((director_id, port_id))
+
+        target_uri = '/performance/FEPort/metrics'
+
+        def _get_port_metrics(director_id, port_id):
+            port_perf_payload = ({"startDate": start_date,
+                                  "endDate": end_date,
+                                  "symmetrixId": self.array_id,
+                                  "directorId": director_id,
+                                  "portId": port_id,
+                                  "dataFormat": dataformat,
+                                  "metrics": metrics})
+            response = self.rest_client.rest_request(
+                target_uri, POST, request_object=port_perf_payload)
+            if not response or not response[0]:
+                LOG.warning("No performance data for port %(dir)s:%(port)s",
+                            {'dir': director_id, 'port': port_id})
+                return []
+            return response[0]['resultList']['result']
+
+        port_results = self._run_concurrently(_get_port_metrics, ports,
+                                              workers)
+
+        timestamps = sorted({sample['timestamp']
+                             for samples in port_results
+                             for sample in samples})
+        column = {timestamp: i for i, timestamp in enumerate(timestamps)}
+        data = {metric: [] for metric in metrics}
+        for samples in port_results:
+            rows = {metric: [None] * len(timestamps) for metric in metrics}
+            for sample in samples:
+                i = column[sample['timestamp']]
+                for metric in metrics:
+                    rows[metric][i] = sample.get(metric)
+            for metric in metrics:
+                data[metric].append(rows[metric])
+
+        sweep_results_combined = dict()
+        sweep_results_combined['symmetrixID'] = self.array_id
+        sweep_results_combined['reporting_level'] = "FEPort"
+        sweep_results_combined['ports'] = ['%s:%s' % port for port in ports]
+        sweep_results_combined['timestamps'] = timestamps
+        sweep_results_combined['perf_data'] = data
+        return sweep_results_combined
+
+    @staticmethod
+    def get_busiest_fe_ports(sweep, metric='PercentBusy', count=10,
+                             aggregate=max):
+        """Rank the ports of a sweep by one of its metrics.
+
+        :param sweep: result of get_fe_port_util_sweep
+        :param metric: the metric used for the ranking
+        :param count: number of ports to return
+        :param aggregate: function reducing a port series to one value
+        :return: list of (port, value) tuples, busiest first
+        """
+        ranking = []
+        for port, row in zip(sweep['ports'], sweep['perf_data'][metric]):
+            values = [value for value in row if value is not None]
+            if values:
+                ranking.append((port, aggregate(values)))
+        ranking.sort(key=lambda item: item[1], reverse=True)
+        return ranking[:count]
+
     def get_fe_director_metrics(self, start_date, end_date,
                                 director, dataformat):
         """Function to get one or more metrics for front end directors.
@@ -2667,6 +2852,53 @@ class RestFunctions:
         director_results_combined['perf_data'] = director_results_list
         return director_results_combined
 
+    @staticmethod
+    def get_director_type(director_id):
+        """Get the performance category of a director from its ID.
+
+        :param director_id: Director ID e.g. FA-1D
+        :return: BE, FE, RDF, IM, EDS or N/A
+        """
+        if 'DF' in director_id or 'DX' in director_id:
+            return 'BE'
+        elif ('EF' in director_id or 'FA' in director_id
+              or 'FE' in director_id or 'SE' in director_id):
+            return 'FE'
+        elif 'RF' in director_id or 'RE' in director_id:
+            return 'RDF'
+        elif 'IM' in director_id:
+            return 'IM'
+        elif 'ED' in director_id:
+            return 'EDS'
+        # Unable to determine Director type
+        return 'N/A'
+
+    def get_director_type_metrics(self, director_id, director_type,
+                                  start_date, end_date):
+        """Get the performance metrics of a director for its category.
+
+        :param director_id: Director ID
+        :param director_type: BE, FE, RDF, IM or EDS
+        :param start_date: start date
+        :param end_date: end date
+        :return: JSON Payload, and RETURN CODE 200 for success, or False
+                 if the director type has no performance category
+        """
+        if director_type not in DIRECTOR_METRICS:
+            return False
+        category, metrics = DIRECTOR_METRICS[director_type]
+        target_uri = '/performance/%s/metrics' % category
+        director_payload = {
+            'symmetrixId': self.array_id,
+            'directorId': director_id,
+            'endDate': end_date,
+            'dataFormat': 'Average',
+            'metrics': metrics,
+            'startDate': start_date
+        }
+        return self.rest_client.rest_request(
+            target_uri, POST, request_object=director_payload)
+
     def get_director_info(self, director_id, start_date, end_date):
         """Get director performance information.
 
@@ -2678,124 +2910,29 @@ class RestFunctions:
         :return: Combined payload of all Director level information
                  & performance metrics
         """
-        # Create Director level target URIs
         director_info, sc = self.get_director(director_id)
-        be_director_uri = '/performance/BEDirector/metrics'
-        fe_director_uri = '/performance/FEDirector/metrics'
-        rdf_director_uri = '/performance/RDFDirector/metrics'
-        im_director_uri = '/performance/IMDirector/metrics'
-        eds_director_uri = '/performance/EDSDirector/metrics'
-
-        # Set BE Director performance metrics payload
-        be_director_payload = {
-            'symmetrixId': self.array_id,
-            'directorId': director_id,
-            'endDate': end_date,
-            'dataFormat': 'Average',
-            'metrics': [
-                'AvgTimePerSyscall', 'CompressedMBs', 'CompressedReadMBs',
-                'CompressedWriteMBs', 'CompressedReadReqs', 'CompressedReqs',
-                'CompressedWriteReqs', 'IOs', 'MBs', 'MBRead', 'MBWritten',
-                'PercentBusy', 'PercentBusyLogicalCore_0',
-                'PercentBusyLogicalCore_1', 'PercentNonIOBusyLogicalCore_1',
-                'PercentNonIOBusyLogicalCore_0', 'PercentNonIOBusy',
-                'PrefetchedTracks', 'ReadReqs', 'Reqs', 'SyscallCount',
-                'Syscall_RDF_DirCount', 'SyscallRemoteDirCount', 'WriteReqs'
-            ],
-            'startDate': self.start_date
-        }
 
-        # Set FE Director performance metrics payload
-        fe_director_payload = {
-            'symmetrixId': self.array_id,
-            'directorId': director_id,
-            'endDate': end_date,
-            'dataFormat': 'Average',
-            'metrics': [
-                'AvgRDFSWriteResponseTime', 'AvgReadMissResponseTime',
-                'AvgWPDiscTime', 'AvgTimePerSyscall', 'DeviceWPEvents',
-                'HostMBs', 'HitReqs', 'HostIOs', 'MissReqs',
-                'AvgOptimizedReadMissSize', 'OptimizedMBReadMisses',
-                'OptimizedReadMisses', 'WriteMissReqs', 'PercentHitReqs',
-                'PercentReadReqs', 'PercentReadReqHit', 'PercentWriteReqs',
-                'PercentWriteReqHit', 'QueueDepthUtilization', 'ReadMissReqs',
-                'HostIOLimitMBs', 'ReadReqs', 'ReadHitReqs', 'Reqs',
-                'ReadResponseTime', 'HostIOLimitIOs', 'WriteResponseTime',
-                'SlotCollisions', 'SyscallCount', 'Syscall_RDF_DirCounts',
-                'SyscallRemoteDirCounts', 'SystemWPEvents', 'TotalReadCount',
-                'TotalWriteCount', 'WriteReqs', 'WriteHitReqs', 'PercentBusy',
-            ],
-            'startDate': start_date
-        }
+        # Director level performance REST call dependent on Director type,
+        # parsed from the Director ID (see get_director_type)
+        director_type = self.get_director_type(director_id)
+        perf_metrics_payload = self.get_director_type_metrics(
+            director_id, director_type, start_date, end_date)
 
-        # Set RDF Director performance metrics payload
-        rdf_director_payload = {
-            'symmetrixId': self.array_id,
-            'directorId': director_id,
-            'endDate': end_date,
-            'dataFormat': 'Average',
-            'metrics': [
-                'AvgIOServiceTime', 'AvgIOSizeReceived', 'AvgIOSizeSent',
-                'AvgTimePerSyscall', 'CopyIOs', 'CopyMBs', 'IOs', 'Reqs',
-                'MBSentAndReceived', 'MBRead', 'MBWritten', 'PercentBusy',
-                'Rewrites', 'AsyncMBSent', 'AsyncWriteReqs', 'SyncMBSent',
-                'SyncWrites', 'SyscallCount', 'Syscall_RDF_DirCounts',
-                'SyscallRemoteDirCount', 'SyscallTime', 'WriteReqs',
-                'TracksSentPerSec', 'TracksReceivedPerSec'
-            ],
-            'startDate': start_date
-        }
+        return self._combine_director_info(director_id, director_type,
+                                           director_info,
+                                           perf_metrics_payload)
 
-        # Set IM Director performance metrics payload
-        im_director_payload = {
-            'symmetrixId': self.array_id,
-            'directorId': director_id,
-            'endDate': self.end_date,
-            'dataFormat': 'Average',
-            'metrics': ['PercentBusy'],
-            'startDate': self.start_date
-        }
-
-        # Set EDS Director performance metrics payload
-        eds_director_payload = {
-            'symmetrixId': self.array_id,
-            'directorId': director_id,
-            'endDate': self.end_date,
-            'dataFormat': 'Average',
-            'metrics': [
-                'PercentBusy', 'RandomReadMissMBs', 'RandomReadMisses',
-                'RandomWriteMissMBs', 'RandomWriteMisses'
-            ],
-            'startDate': self.start_date
-        }
-
-        # Perform Director level performance REST call dependent on Director type
-        if 'DF' in director_id or 'DX' in director_id:
-            perf_metrics_payload = self.rest_client.rest_request(
-                be_director_uri, POST, request_object=be_director_payload)
-            director_type = 'BE'
-        elif ('EF' in director_id or 'FA' in director_id
-              or 'FE' in director_id or 'SE' in director_id):
-            perf_metrics_payload = self.rest_client.rest_request(
-                fe_director_uri, POST, request_object=fe_director_payload)
-            director_type = 'FE'
-        elif 'RF' in director_id or 'RE' in director_id:
-            perf_metrics_payload = self.rest_client.rest_request(
-                rdf_director_uri, POST, request_object=rdf_director_payload)
-            director_type = 'RDF'
-        elif 'IM' in director_id:
-            perf_metrics_payload = self.rest_client.rest_request(
-                im_director_uri, POST, request_object=im_director_payload)
-            director_type = 'IM'
-        elif 'ED' in director_id:
-            perf_metrics_payload = self.rest_client.rest_request(
-                eds_director_uri, POST, request_object=eds_director_payload)
-            director_type = 'EDS'
-        else:
-            # Unable to determine Director type, set to N/A
-            perf_metrics_payload = False
-            director_type = 'N/A'
+    def _combine_director_info(self, director_id, director_type,
+                               director_info, perf_metrics_payload):
+        """Build the combined payload of get_director_info.
 
+        :param director_id: Director ID
+        :param director_type: BE, FE, RDF, IM, EDS or N/A
+        :param director_info: response of get_director
+        :param perf_metrics_payload: response of get_director_type_metrics
+        :return: Combined payload of all Director level information
+                 & performance metrics
+        """
         # Set combined payload values not present in returned REST metrics
         combined_payload = dict()
         combined_payload['reporting_level'] = "Director"
@@ -2814,7 +2951,7 @@ class RestFunctions:
                 combined_payload[k] = v
 
         # If no Director level performance information is retrieved...
-        if not perf_metrics_payload:
+        if not perf_metrics_payload or not perf_metrics_payload[0]:
             combined_payload['perf_data'] = False
             combined_payload['perf_msg'] = ("No active Director "
                                             "performance data available")
@@ -2826,6 +2963,51 @@ class RestFunctions:
 
         return combined_payload
 
+    def get_all_director_info(self, start_date, end_date,
+                              workers=PERF_WORKERS):
+        """Get information and performance metrics of every director.
+
+        The get_director and metrics requests of all directors run
+        concurrently. Only the performance category matching the type
+        of each director (derived from the director IDs reported by
+        get_director) is requested.
+        :param start_date: start date
+        :param end_date: end date
+        :param workers: maximum number of concurrent requests
+        :return: columnar payload, one list per attribute, with one
+                 entry per director
+        """
+        directors, sc = self.get_director()
+        dir_list = directors['directorId'] if directors else []
+        dir_types = [self.get_director_type(director) for director in dir_list]
+
+        requests = [(self.get_director, (director,))
+                    for director in dir_list]
+        requests += [(self.get_director_type_metrics,
+                      (director, director_type, start_date, end_date))
+                     for director, director_type in zip(dir_list, dir_types)
+                     if director_type in DIRECTOR_METRICS]
+        responses = iter(self._run_concurrently(
+            lambda function, args: function(*args), requests, workers))
+
+        infos = [next(responses)[0] for _ in dir_list]
+        rows = []
+        for director, director_type, info in zip(dir_list, dir_types, infos):
+            perf = (next(responses) if director_type in DIRECTOR_METRICS
+                    else False)
+            rows.append(self._combine_director_info(director, director_type,
+                                                    info, perf))
+
+        columns = []
+        for row in rows:
+            columns += [key for key in row if key not in columns]
+        director_results_combined = dict()
+        director_results_combined['symmetrixID'] = self.array_id
+        director_results_combined['reporting_level'] = "Director"
+        director_results_combined['columns'] = {
+            column: [row.get(column) for row in rows] for column in columns}
+        return director_results_combined
+
     def get_port_group_metrics(self, pg_id, start_date, end_date):
         """Get Port Group Performance Metrics.
 
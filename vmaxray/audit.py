@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+from vmaxray.formatters import Formatter
+
+__author__ = 'Julien B.'
+
+# Checks of the audit -> (section of the objects, description)
+CHECKS = {'unmapped_volume': ('volume', 'TDEV in no storage group'),
+          'sg_without_view': ('storage_group', 'SG in no masking view'),
+          'ig_without_view': ('initiator_group', 'IG in no masking view'),
+          'pg_without_view': ('port_group', 'PG in no masking view'),
+          'initiator_not_logged_in': ('initiator', 'Initiator not logged in'),
+          'initiator_not_on_fabric': ('initiator', 'Initiator not on fabric'),
+          'cascaded_ig_without_view': ('initiator_cascaded_group',
+                                       'Cascaded IG in no masking view')}
+
+
+class AuditFormatter(Formatter):
+    """ Find the orphan and misconfigured objects of an inventory
+
+    Only the IDs the checks need are kept while the inventory goes on. The
+    findings are computed by set operations once it is complete, and sent
+    to another formatter: this formatter has to be closed first.
+    """
+
+    def __init__(self, sid: str, findings: Formatter):
+        """Constructor
+        :param sid: SID of the array
+        :param findings: Formatter receiving the findings
+        """
+        super().__init__()
+        self._sid = sid
+        self._findings = findings
+
+        self._unmapped_volumes = set()
+        self._storage_groups = set()
+        self._parent_storage_groups = {}  # child SG -> parent SGs
+        self._initiator_groups = set()
+        self._cascaded_groups = set()
+        self._port_groups = set()
+        self._not_logged_in = set()
+        self._not_on_fabric = set()
+        self._initiator_hosts = {}  # initiator -> IG, detail of the findings
+
+        # Objects used by a masking view, directly or not
+        self._viewed = {'storage_group': set(), 'initiator_group': set(),
+                        'initiator_cascaded_group': set(),
+                        'port_group': set()}
+        self._cascaded_members = {}  # cascaded IG -> IGs
+
+    def add_volume(self, vol_data):
+        if not vol_data.get('num_of_storage_groups'):
+            self._unmapped_volumes.add(vol_data['volumeId'])
+
+    def add_storage_group(self, sg_data):
+        self._storage_groups.add(sg_data['storageGroupId'])
+        if sg_data.get('maskingview'):
+            self._viewed['storage_group'].add(sg_data['storageGroupId'])
+        parents = sg_data.get('parent_storage_group') or []
+        if isinstance(parents, str):
+            parents = [parents]
+        if parents:
+            self._parent_storage_groups[sg_data['storageGroupId']] = set(
+                parents)
+
+    def add_masking_view(self, view_data):
+        self._viewed['storage_group'].add(view_data.get('storageGroupId'))
+        self._viewed['port_group'].add(view_data.get('portGroupId'))
+        self._viewed['initiator_group'].add(view_data.get('hostId'))
+        self._viewed['initiator_cascaded_group'].add(
+            view_data.get('hostGroupId'))
+
+    def add_initiator_group(self, init_data):
+        self._initiator_groups.add(init_data['hostId'])
+        if init_data.get('maskingview'):
+            self._viewed['initiator_group'].add(init_data['hostId'])
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._cascaded_groups.add(init_data['hostGroupId'])
+        self._cascaded_members[init_data['hostGroupId']] = {
+            host['hostId'] if isinstance(host, dict) else host
+            for host in init_data.get('host') or []}
+        if init_data.get('num_of_masking_views'):
+            self._viewed['initiator_cascaded_group'].add(
+                init_data['hostGroupId'])
+
+    def add_port_group(self, pg_data):
+        self._port_groups.add(pg_data['portGroupId'])
+        if pg_data.get('num_of_masking_views') or pg_data.get('maskingview'):
+            self._viewed['port_group'].add(pg_data['portGroupId'])
+
+    def add_initiator(self, init_data):
+        initiator = init_data['initiatorId']
+        self._initiator_hosts[initiator] = init_data.get('host')
+        if not init_data.get('logged_in'):
+            self._not_logged_in.add(initiator)
+        if not init_data.get('on_fabric'):
+            self._not_on_fabric.add(initiator)
+
+    def add_srp(self, srp_data):
+        pass
+
+    def findings(self):
+        """ Return the findings: dicts (sid, check, section, object, detail)
+        """
+        # An IG is masked through the masked cascaded IGs it belongs to
+        viewed_groups = self._viewed['initiator_group'].union(
+            *[self._cascaded_members.get(group, set())
+              for group in self._viewed['initiator_cascaded_group']])
+
+        # A child SG is masked through its masked parents
+        viewed_storage_groups = self._viewed['storage_group'].union(
+            child for child, parents in self._parent_storage_groups.items()
+            if parents & self._viewed['storage_group'])
+
+        results = {
+            'unmapped_volume': self._unmapped_volumes,
+            'sg_without_view': (self._storage_groups -
+                                viewed_storage_groups),
+            'ig_without_view': self._initiator_groups - viewed_groups,
+            'pg_without_view': (self._port_groups -
+                                self._viewed['port_group']),
+            'initiator_not_logged_in': self._not_logged_in,
+            'initiator_not_on_fabric': self._not_on_fabric,
+            'cascaded_ig_without_view': (
+                self._cascaded_groups -
+                self._viewed['initiator_cascaded_group'])}
+
+        findings = []
+        for check, objects in results.items():
+            section, description = CHECKS[check]
+            for name in sorted(objects):
+                detail = description
+                if section == 'initiator' and self._initiator_hosts.get(name):
+                    detail += ' (IG %s)' % self._initiator_hosts[name]
+                findings.append({'sid': self._sid, 'check': check,
+                                 'section': section, 'object': name,
+                                 'detail': detail})
+        return findings
+
+    def close(self):
+        if self._findings is None:
+            return
+        findings = self.findings()
+        self._logger.info('%d findings in the audit of %s' %
+                          (len(findings), self._sid))
+        for finding in findings:
+            self._findings.add_finding(finding)
+        self._findings = None
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import csv
+import logging
+import sqlite3
+import threading
+import time
+from vmaxray.errors import CapacityHistoryError
+from vmaxray.formatters import Formatter, COLUMNS
+
+__author__ = 'Julien B.'
+
+DAY = 86400  # capacity timestamps are EPOCH seconds
+WEEK = 7 * DAY
+DAILY_RETENTION = 90 * DAY  # older points are downsampled to one per week
+
+# Section -> capacity attributes kept in the history
+METRICS = {'srp': ['total_usable_cap_gb', 'total_allocated_cap_gb',
+                   'total_subscribed_cap_gb',
+                   'effective_used_capacity_percent'],
+           'storage_group': ['cap_gb']}
+
+# Forecasts: section -> (capacity metrics, metric they are compared to)
+FORECASTS = {'srp': (['total_allocated_cap_gb', 'total_subscribed_cap_gb'],
+                     'total_usable_cap_gb'),
+             'storage_group': (['cap_gb'], None)}
+FORECAST_FIELDS = COLUMNS['forecast'][0]
+HORIZON = 5 * 365  # days, no date forecasted beyond
+
+
+def day_start(timestamp: int):
+    return timestamp - timestamp % DAY
+
+
+def week_start(timestamp: int):
+    # EPOCH was a Thursday: weeks start on Monday
+    return timestamp - (timestamp + 3 * DAY) % WEEK
+
+
+class CapacityHistory(object):
+    """ Capacity time series of the SRPs and SGs of a fleet of arrays
+
+    Each (array, section, object, metric) is a series of points, stored in
+    a SQLite database: one point per day (the last capture of the day), then
+    one point per week (the last capture of the week) after 90 days.
+    """
+
+    _schema = ['CREATE TABLE IF NOT EXISTS series ('
+               'id INTEGER PRIMARY KEY, sid TEXT, section TEXT, '
+               'object TEXT, metric TEXT, '
+               'UNIQUE (sid, section, object, metric))',
+               'CREATE TABLE IF NOT EXISTS points ('
+               'series INTEGER, ts INTEGER, value REAL, '
+               'PRIMARY KEY (series, ts)) WITHOUT ROWID']
+
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: SQLite database of the history (created if needed)
+        """
+        self._logger = logging.getLogger('vmaxray')
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                for statement in self._schema:
+                    self._db.execute(statement)
+        except sqlite3.Error as error:
+            self._logger.error('Unable to open the capacity history %s (%s)'
+                               % (path, error))
+            raise CapacityHistoryError('Unable to open the capacity history '
+                                       '%s' % path)
+        self._series = {}  # (sid, section, object, metric) -> series id
+        self._lock = threading.Lock()  # arrays may be collected in parallel
+
+    def _series_id(self, sid: str, section: str, name: str, metric: str):
+        key = (sid, section, name, metric)
+        if key not in self._series:
+            self._db.execute('INSERT OR IGNORE INTO series '
+                             '(sid, section, object, metric) '
+                             'VALUES (?, ?, ?, ?)', key)
+            self._series[key] = self._db.execute(
+                'SELECT id FROM series WHERE sid = ? AND section = ? AND '
+                'object = ? AND metric = ?', key).fetchone()[0]
+        return self._series[key]
+
+    def append(self, sid: str, section: str, data: dict, timestamp: int):
+        """ Add the capacity of an object captured at a given time
+
+        :param sid: SID of the array
+        :param section: srp or storage_group
+        :param data: record of the object
+        :param timestamp: EPOCH Time of the capture in seconds
+        """
+        name = data['srpId' if section == 'srp' else 'storageGroupId']
+        with self._lock:
+            rows = [(self._series_id(sid, section, name, metric),
+                     day_start(timestamp), data[metric])
+                    for metric in METRICS[section]
+                    if data.get(metric) is not None]
+            self._db.executemany('INSERT OR REPLACE INTO points '
+                                 'VALUES (?, ?, ?)', rows)
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def downsample(self, now: int = None):
+        """ Keep one point per week for the points older than 90 days """
+        now = int(time.time()) if now is None else now
+        limit = week_start(now - DAILY_RETENTION)
+        with self._lock, self._db:
+            self._db.execute('CREATE TEMP TABLE weekly AS '
+                             'SELECT series, ts - (ts + ?) % ? AS week, '
+                             'value, MAX(ts) FROM points WHERE ts < ? '
+                             'GROUP BY series, week', (3 * DAY, WEEK, limit))
+            self._db.execute('DELETE FROM points WHERE ts < ?', (limit,))
+            self._db.execute('INSERT INTO points '
+                             'SELECT series, week, value FROM weekly')
+            self._db.execute('DROP TABLE weekly')
+
+    def _query(self, query: str, parameters):
+        # The connection is shared by the threads of the arrays
+        with self._lock:
+            return self._db.execute(query, parameters).fetchall()
+
+    def series(self, sid: str, section: str, name: str, metric: str):
+        """ Return the (timestamps, values) of a series """
+        rows = self._query(
+            'SELECT ts, value FROM points JOIN series ON series = id '
+            'WHERE sid = ? AND section = ? AND object = ? AND metric = ? '
+            'ORDER BY ts', (sid, section, name, metric))
+        return [row[0] for row in rows], [row[1] for row in rows]
+
+    def growth(self, section: str, metric: str, since: int, sid: str = None):
+        """ Growth of a metric of every object of the fleet since a date
+
+        Computed by a single query over the whole fleet.
+        :param section: srp or storage_group
+        :param metric: e.g. total_allocated_cap_gb
+        :param since: EPOCH Time in seconds
+        :param sid: restrict to an array, optional
+        :return: list of dicts (sid, object, start, end, first, last,
+                 growth, growth_percent), fastest growing first
+        """
+        query = ('SELECT sid, object, '
+                 'MIN(ts), MAX(ts), '
+                 '(SELECT value FROM points WHERE series = id AND ts >= ? '
+                 ' ORDER BY ts LIMIT 1), '
+                 '(SELECT value FROM points WHERE series = id '
+                 ' ORDER BY ts DESC LIMIT 1) '
+                 'FROM series JOIN points ON series = id '
+                 'WHERE section = ? AND metric = ? AND ts >= ?')
+        parameters = [since, section, metric, since]
+        if sid:
+            query += ' AND sid = ?'
+            parameters.append(sid)
+        query += ' GROUP BY id'
+
+        results = []
+        for sid, name, start, end, first, last in self._query(query,
+                                                              parameters):
+            results.append({'sid': sid, 'object': name, 'start': start,
+                            'end': end, 'first': first, 'last': last,
+                            'growth': last - first,
+                            'growth_percent': ((last - first) * 100.0 / first
+                                               if first else None)})
+        results.sort(key=lambda item: item['growth'], reverse=True)
+        return results
+
+    def trends(self, section: str, metric: str, since: int, now: int = None,
+               sid: str = None):
+        """ Linear trend of a metric of every object of the fleet
+
+        The least squares fits of all the series are computed at once: the
+        sums they need are aggregated by a single query.
+        :param section: srp or storage_group
+        :param metric: e.g. total_allocated_cap_gb
+        :param since: EPOCH Time in seconds of the first point used
+        :param now: EPOCH Time in seconds the trends are evaluated at
+        :param sid: restrict to an array, optional
+        :return: list of dicts (sid, object, samples, last, slope, value):
+                 slope in units per day (None with a single point) and value
+                 the fitted value at now
+        """
+        now = int(time.time()) if now is None else now
+        # Days relative to now: the fitted value at now is the intercept
+        query = ('SELECT sid, object, COUNT(*), SUM(x), SUM(y), SUM(x * x), '
+                 'SUM(x * y), y, MAX(ts) FROM series JOIN '
+                 '(SELECT series, ts, (ts - ?) / %f AS x, value AS y '
+                 ' FROM points WHERE ts >= ?) ON series = id '
+                 'WHERE section = ? AND metric = ?' % DAY)
+        parameters = [now, since, section, metric]
+        if sid:
+            query += ' AND sid = ?'
+            parameters.append(sid)
+        query += ' GROUP BY id'
+
+        results = []
+        for (sid, name, count, sum_x, sum_y, sum_xx, sum_xy, last,
+             end) in self._query(query, parameters):
+            denominator = count * sum_xx - sum_x * sum_x
+            if count < 2 or denominator == 0:
+                slope, value = None, last
+            else:
+                slope = (count * sum_xy - sum_x * sum_y) / denominator
+                value = (sum_y - slope * sum_x) / count
+            results.append({'sid': sid, 'object': name, 'samples': count,
+                            'last': last, 'slope': slope, 'value': value})
+        return results
+
+    def forecast(self, threshold: float = 80.0, since: int = None,
+                 now: int = None, sid: str = None):
+        """ Forecast the capacity of the SRPs and SGs of the fleet
+
+        :param threshold: percentage of the usable capacity of an SRP
+        :param since: EPOCH Time in seconds of the first point used, the
+                      last 90 days by default
+        :param now: EPOCH Time in seconds of the forecast, now by default
+        :param sid: restrict to an array, optional
+        :return: list of dicts (FORECAST_FIELDS): growth per day and, for
+                 the SRPs, days left and date when the threshold is reached
+        """
+        now = int(time.time()) if now is None else now
+        since = now - DAILY_RETENTION if since is None else since
+
+        rows = []
+        for section, (metrics, reference) in FORECASTS.items():
+            capacities = {}
+            if reference:
+                capacities = {(trend['sid'], trend['object']): trend['last']
+                              for trend in self.trends(section, reference,
+                                                       since, now, sid)}
+            for metric in metrics:
+                for trend in self.trends(section, metric, since, now, sid):
+                    capacity = capacities.get((trend['sid'], trend['object']))
+                    row = {'sid': trend['sid'], 'section': section,
+                           'object': trend['object'], 'metric': metric,
+                           'samples': trend['samples'],
+                           'last_value': trend['last'],
+                           'growth_per_day': trend['slope'],
+                           'capacity': capacity, 'threshold': None,
+                           'days_left': None, 'date': None}
+                    if capacity:
+                        row['threshold'] = threshold
+                        row['days_left'] = _days_left(
+                            trend, capacity * threshold / 100.0)
+                    if row['days_left'] is not None:
+                        row['date'] = time.strftime(
+                            '%Y-%m-%d',
+                            time.gmtime(now + row['days_left'] * DAY))
+                    rows.append(row)
+
+        rows.sort(key=lambda row: (row['days_left'] is None,
+                                   row['days_left'] or 0))
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def _days_left(trend: dict, limit: float):
+    """ Days before a trend reaches a limit (None if it never does) """
+    if trend['value'] >= limit:
+        return 0
+    if not trend['slope'] or trend['slope'] < 0:
+        return None
+    days = (limit - trend['value']) / trend['slope']
+    return round(days) if days <= HORIZON else None
+
+
+def export_csv(rows: list, path: str):
+    """ Write the rows of CapacityHistory.forecast into a CSV file """
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=FORECAST_FIELDS,
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def export_formatter(rows: list, formatter: Formatter):
+    """ Send the rows of CapacityHistory.forecast to a Formatter """
+    for row in rows:
+        formatter.add_forecast(row)
+
+
+class CapacityHistoryFormatter(Formatter):
+    """ Append the SRP and SG capacities of an inventory to the history
+
+    Optionally, the forecast of the array is sent to another formatter once
+    the capacities are recorded: this formatter has to be closed first.
+    """
+
+    def __init__(self, history: CapacityHistory, sid: str,
+                 timestamp: int = None, forecast: Formatter = None,
+                 threshold: float = 80.0):
+        """Constructor
+        :param history: Capacity history receiving the points
+        :param sid: SID of the array
+        :param timestamp: EPOCH Time of the capture in seconds, now by
+                          default
+        :param forecast: Formatter receiving the forecast of the array
+        :param threshold: SRP threshold of the forecast (% of usable)
+        """
+        super().__init__()
+        self._history = history
+        self._sid = sid
+        self._timestamp = (int(time.time()) if timestamp is None
+                           else timestamp)
+        self._forecast = forecast
+        self._threshold = threshold
+
+    def add_srp(self, srp_data):
+        self._history.append(self._sid, 'srp', srp_data, self._timestamp)
+
+    def add_storage_group(self, sg_data):
+        self._history.append(self._sid, 'storage_group', sg_data,
+                             self._timestamp)
+
+    def add_volume(self, vol_data):
+        pass
+
+    def add_initiator(self, init_data):
+        pass
+
+    def add_initiator_group(self, init_data):
+        pass
+
+    def add_initiator_cascaded_group(self, init_data):
+        pass
+
+    def add_port_group(self, pg_data):
+        pass
+
+    def add_masking_view(self, view_data):
+        pass
+
+    def close(self):
+        self._history.commit()
+        self._history.downsample(self._timestamp)
+        if self._forecast:
+            export_formatter(self._history.forecast(self._threshold,
+                                                    now=self._timestamp,
+                                                    sid=self._sid),
+                             self._forecast)
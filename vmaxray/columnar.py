@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import mmap
+import os
+import zlib
+from array import array
+from vmaxray.errors import ColumnarFormatterError
+from vmaxray.formatters import Formatter, flatten_item
+
+__author__ = 'Julien B.'
+
+META_FILE = 'meta.json'
+BATCH = 4096  # rows buffered per column before being written
+
+# Columns of the TDEV snapshot -> encoding
+#   float: float64, None stored as NaN
+#   int:   int64, None stored as -1
+#   bool:  int8, None stored as -1
+#   dict:  uint32 codes in a dictionary of strings, None stored as 2**32-1
+#   str:   utf-8 values separated by newlines, None stored as NUL
+VOLUME_COLUMNS = {'volumeId': 'str',
+                  'wwn': 'str',
+                  'effective_wwn': 'str',
+                  'cap_gb': 'float',
+                  'cap_mb': 'float',
+                  'cap_cyl': 'int',
+                  'allocated_percent': 'float',
+                  'num_of_storage_groups': 'int',
+                  'emulation': 'dict',
+                  'status': 'dict',
+                  'type': 'dict',
+                  'storageGroupId': 'dict',
+                  'snapvx_source': 'bool',
+                  'snapvx_target': 'bool'}
+
+TYPECODES = {'float': 'd', 'int': 'q', 'bool': 'b', 'dict': 'I'}
+NULLS = {'float': float('nan'), 'int': -1, 'bool': -1, 'dict': 2 ** 32 - 1}
+
+
+class _ColumnWriter(object):
+    """ Write one column of the snapshot, by batch of rows """
+
+    def __init__(self, filename: str, encoding: str, compress: bool):
+        self._file = open(filename, 'wb')
+        self._encoding = encoding
+        self._compressor = zlib.compressobj() if compress else None
+        self._dictionary = {}
+        self._batch = []
+
+    def append(self, value):
+        if isinstance(value, list):
+            value = ', '.join(str(flatten_item(item)) for item in value)
+
+        if self._encoding == 'dict':
+            if value is not None:
+                value = self._dictionary.setdefault(value,
+                                                    len(self._dictionary))
+        elif self._encoding == 'str':
+            value = '\0' if value is None else str(value)
+        elif self._encoding == 'bool' and value is not None:
+            value = int(bool(value))
+
+        self._batch.append(NULLS[self._encoding] if value is None else value)
+        if len(self._batch) >= BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self._encoding == 'str':
+            data = ''.join(value + '\n' for value in self._batch).encode()
+        else:
+            data = array(TYPECODES[self._encoding], self._batch).tobytes()
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._file.write(data)
+        self._batch = []
+
+    def close(self):
+        self._flush()
+        if self._compressor:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+
+    @property
+    def dictionary(self):
+        return sorted(self._dictionary, key=self._dictionary.get)
+
+
+class ColumnarFormatter(Formatter):
+    """ Write the TDEV section under a columnar snapshot
+
+    The snapshot is a directory holding one file per column plus a
+    meta.json describing the encoding of the columns and the dictionaries
+    of the dictionary encoded ones. The other sections are ignored.
+    """
+
+    def __init__(self, path: str, filename: str, compress: bool = True):
+        """Constructor
+        :param path: Where create the snapshot
+        :param filename: Name of the snapshot directory
+        :param compress: Compress the columns with zlib. Uncompressed
+                         numeric columns can be read without any copy.
+        """
+        super().__init__()
+
+        if not os.path.isdir(path):
+            self._logger.error('Path incorrect (%s)' % path)
+            raise ColumnarFormatterError('Path incorrect (%s)' % path)
+
+        if not os.access(path, os.W_OK):
+            self._logger.error('Insufficient rights on %s' % path)
+            raise ColumnarFormatterError('Insufficient rights on %s' % path)
+
+        self._logger.info('Initializing a columnar snapshot (%s%s)' %
+                          (filename, os.path.sep))
+        self._target = path + os.path.sep + filename
+        os.makedirs(self._target, exist_ok=True)
+
+        self._compress = compress
+        self._rows = 0
+        self._columns = {name: _ColumnWriter(self._column_file(name),
+                                             encoding, compress)
+                         for name, encoding in VOLUME_COLUMNS.items()}
+
+    def _column_file(self, name: str):
+        return '%s%s%s.col' % (self._target, os.path.sep, name)
+
+    def add_volume(self, vol_data):
+        for name, column in self._columns.items():
+            column.append(vol_data.get(name))
+        self._rows += 1
+
+    def add_initiator(self, init_data):
+        pass
+
+    def add_initiator_group(self, init_data):
+        pass
+
+    def add_initiator_cascaded_group(self, init_data):
+        pass
+
+    def add_port_group(self, pg_data):
+        pass
+
+    def add_storage_group(self, sg_data):
+        pass
+
+    def add_masking_view(self, view_data):
+        pass
+
+    def add_srp(self, srp_data):
+        pass
+
+    def close(self):
+        if self._columns is None:
+            return
+
+        meta = {'rows': self._rows, 'compress': self._compress, 'columns': {}}
+        for name, column in self._columns.items():
+            column.close()
+            meta['columns'][name] = {'encoding': VOLUME_COLUMNS[name]}
+            if VOLUME_COLUMNS[name] == 'dict':
+                meta['columns'][name]['dictionary'] = column.dictionary
+
+        with open(self._target + os.path.sep + META_FILE, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        self._columns = None
+
+
+class ColumnarSnapshot(object):
+    """ Read the columns of a snapshot written by ColumnarFormatter """
+
+    def __init__(self, path: str):
+        """Constructor
+        :param path: directory of the snapshot
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        try:
+            with open(path + os.path.sep + META_FILE) as meta_file:
+                self._meta = json.load(meta_file)
+        except (OSError, ValueError):
+            self._logger.error('Invalid columnar snapshot %s' % path)
+            raise ColumnarFormatterError('Invalid columnar snapshot %s' % path)
+
+    def __len__(self):
+        return self._meta['rows']
+
+    @property
+    def columns(self):
+        return sorted(self._meta['columns'])
+
+    def _read(self, name: str):
+        """ Memory-map the file of a column """
+        if name not in self._meta['columns']:
+            raise KeyError(name)
+        filename = '%s%s%s.col' % (self._path, os.path.sep, name)
+        with open(filename, 'rb') as column_file:
+            if os.fstat(column_file.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def raw(self, name: str):
+        """ Return the stored values of a column
+
+        Numeric and bool columns are returned as arrays (or as memoryviews
+        over the mapped file when the snapshot is not compressed), dict
+        columns as their codes and str columns as a list of strings.
+        """
+        encoding = self._meta['columns'][name]['encoding']
+        data = self._read(name)
+        if self._meta['compress']:
+            data = zlib.decompress(data)
+
+        if encoding == 'str':
+            values = bytes(data).decode().split('\n')[:-1]
+            return [None if value == '\0' else value for value in values]
+
+        if not self._meta['compress'] and data:
+            return memoryview(data).cast(TYPECODES[encoding])
+        column = array(TYPECODES[encoding])
+        column.frombytes(data)
+        return column
+
+    def dictionary(self, name: str):
+        return self._meta['columns'][name].get('dictionary')
+
+    def column(self, name: str):
+        """ Return the values of a column, dict columns decoded """
+        values = self.raw(name)
+        if self._meta['columns'][name]['encoding'] != 'dict':
+            return values
+        dictionary = self.dictionary(name) + [None]
+        null = NULLS['dict']
+        return [dictionary[-1 if code == null else code] for code in values]
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import unquote
+from vmaxray.formatters import Formatter, SECTIONS
+from vmaxray.scope import Scope
+from vmaxray.vmax_inventory import VmaxInventoryFactory
+from vmaxray.wwn_index import normalize
+from vmaxray.PyU4V.rest_univmax2 import RestFunctions
+
+__author__ = 'Julien B.'
+
+
+class MemoryInventory(Formatter):
+    """ Inventory of an array kept in memory, indexed for the lookups
+
+    The objects of each section are kept by ID; the WWNs, the volumes of
+    the storage groups and the masking views of the storage groups and of
+    the hosts (initiator groups and cascaded initiator groups) are indexed
+    while the inventory goes on.
+    """
+
+    def __init__(self, sid: str):
+        """Constructor
+        :param sid: SID of the array
+        """
+        super().__init__()
+        self.sid = sid
+        self.collected = None  # EPOCH time of the end of the inventory
+        self.failed = 0  # objects that could not be collected
+        self.sections = {section: {} for section in SECTIONS}
+        self._wwns = {}  # normalized WWN -> (section, ID)
+        self._sg_volumes = {}  # SG -> volumes
+        self._sg_views = {}  # SG -> masking views
+        self._host_views = {}  # IG or cascaded IG -> masking views
+        self._parents = {}  # IG -> cascaded IGs
+
+    def _add(self, section: str, data):
+        self.sections[section][data[SECTIONS[section]]] = data
+
+    def add_volume(self, vol_data):
+        self._add('volume', vol_data)
+        for attribute in ('wwn', 'effective_wwn'):
+            if vol_data.get(attribute):
+                self._wwns[normalize(vol_data[attribute])] = (
+                    'volume', vol_data['volumeId'])
+        for sg in vol_data.get('storageGroupId') or []:
+            self._sg_volumes.setdefault(sg, []).append(vol_data['volumeId'])
+
+    def add_initiator(self, init_data):
+        self._add('initiator', init_data)
+        self._wwns[normalize(init_data['initiatorId'])] = (
+            'initiator', init_data['initiatorId'])
+
+    def add_masking_view(self, view_data):
+        self._add('masking_view', view_data)
+        view = view_data['maskingViewId']
+        self._sg_views.setdefault(view_data.get('storageGroupId'),
+                                  []).append(view)
+        host = view_data.get('hostId') or view_data.get('hostGroupId')
+        self._host_views.setdefault(host, []).append(view)
+
+    def add_initiator_group(self, init_data):
+        self._add('initiator_group', init_data)
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._add('initiator_cascaded_group', init_data)
+        for host in init_data.get('host') or []:
+            host = host['hostId'] if isinstance(host, dict) else host
+            self._parents.setdefault(host, []).append(init_data['hostGroupId'])
+
+    def add_port_group(self, pg_data):
+        self._add('port_group', pg_data)
+
+    def add_storage_group(self, sg_data):
+        self._add('storage_group', sg_data)
+
+    def add_srp(self, srp_data):
+        self._add('srp', srp_data)
+
+    def close(self):
+        self.collected = int(time.time())
+
+    def summary(self):
+        return {'sid': self.sid, 'collected': self.collected,
+                'failed': self.failed,
+                'objects': {section: len(objects) for section, objects
+                            in self.sections.items()}}
+
+    def volume(self, volume_id: str):
+        """ Return a volume with its SGs, masking views and hosts """
+        volume = self.sections['volume'].get(volume_id.upper())
+        if volume is None:
+            return None
+        sgs = list(volume.get('storageGroupId') or [])
+        views = sorted({view for sg in sgs
+                        for view in self._sg_views.get(sg, [])})
+        return {'sid': self.sid, 'volume': volume, 'storage_groups': sgs,
+                'masking_views': views, 'hosts': self._view_hosts(views)}
+
+    def wwn(self, wwn: str):
+        """ Return the volume or the initiator of a WWN """
+        if normalize(wwn) not in self._wwns:
+            return None
+        section, object_id = self._wwns[normalize(wwn)]
+        return {'sid': self.sid, 'section': section,
+                section: self.sections[section][object_id]}
+
+    def storage_group(self, name: str):
+        """ Return a storage group with its volumes, masking views and hosts
+        """
+        sg = self.sections['storage_group'].get(name)
+        if sg is None:
+            return None
+        views = self._sg_views.get(name, [])
+        return {'sid': self.sid, 'storage_group': sg,
+                'volumes': self._sg_volumes.get(name, []),
+                'masking_views': views, 'hosts': self._view_hosts(views)}
+
+    def host(self, name: str):
+        """ Return an initiator group (or a cascaded one) with its masking
+        views, storage groups and volumes
+        """
+        host = self.sections['initiator_group'].get(name)
+        if host is None:
+            host = self.sections['initiator_cascaded_group'].get(name)
+        if host is None:
+            return None
+        # An IG is masked by its views and by the views of its cascaded IGs
+        views = sorted({view for group in [name] + self._parents.get(name, [])
+                        for view in self._host_views.get(group, [])})
+        sgs = sorted({self.sections['masking_view'][view].get(
+            'storageGroupId') for view in views} - {None})
+        volumes = sorted({volume for sg in sgs
+                          for volume in self._sg_volumes.get(sg, [])})
+        return {'sid': self.sid, 'host': host, 'masking_views': views,
+                'storage_groups': sgs, 'volumes': volumes}
+
+    def _view_hosts(self, views: list):
+        masking_views = self.sections['masking_view']
+        return sorted({masking_views[view].get('hostId') or
+                       masking_views[view].get('hostGroupId')
+                       for view in views if view in masking_views} - {None})
+
+
+class InventoryCache(object):
+    """ Latest inventory of each array, refreshed in the background
+
+    An array is inventoried into a new MemoryInventory, which replaces the
+    previous one once complete: the queries are always answered from a
+    complete inventory, the previous one while the refresh goes on (or when
+    it fails, objects that could not be requested included). The first
+    inventory of an array is served even if objects are missing (counted
+    in failed).
+    """
+
+    def __init__(self, arrays: list, interval: int, shards: int = 0,
+                 prefetch: int = 0):
+        """Constructor
+
+        :param arrays: (RestFunctions, Scope) of the arrays to inventory
+        :param interval: seconds between the beginning of two refreshes
+        :param shards: number of connections requesting the TDEVs
+        :param prefetch: requests in flight per connection (0: one at a time)
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._arrays = arrays
+        self._interval = interval
+        self._shards = shards
+        self._prefetch = prefetch
+        self._inventories = {}  # SID -> MemoryInventory
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def inventories(self):
+        return list(self._inventories.values())
+
+    def get(self, sid: str):
+        return self._inventories.get(sid)
+
+    def refresh(self, vmax: RestFunctions, scope: Scope = None):
+        """ Inventory an array and replace its inventory """
+        inventory = MemoryInventory(vmax.array_id)
+        start = time.time()
+        try:
+            collector = VmaxInventoryFactory(sid=vmax.array_id)
+            collector.collect(formatter=inventory, array=vmax, scope=scope,
+                              shards=self._shards, prefetch=self._prefetch)
+        except Exception as error:
+            self._logger.error('Refresh of %s failed (%s), keeping the '
+                               'previous inventory' % (vmax.array_id, error))
+            return False
+
+        # Objects skipped on errors: the inventory is not complete
+        failed = sum(len(ids) for ids in collector.failed.values())
+        if failed and vmax.array_id in self._inventories:
+            self._logger.error('Refresh of %s failed (%d objects not '
+                               'collected), keeping the previous inventory'
+                               % (vmax.array_id, failed))
+            return False
+        if failed:
+            self._logger.warning('%d objects of %s not collected' %
+                                 (failed, vmax.array_id))
+        inventory.failed = failed
+        self._inventories[vmax.array_id] = inventory  # atomic swap
+        self._logger.info('%s refreshed in %.1fs' %
+                          (vmax.array_id, time.time() - start))
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            start = time.time()
+            for vmax, scope in self._arrays:
+                if self._stopped.is_set():
+                    return
+                self.refresh(vmax, scope)
+            self._stopped.wait(max(0, self._interval - (time.time() - start)))
+
+    def start(self):
+        """ Refresh the inventories in a background thread """
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='vmaxray-refresh')
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class InventoryRequestHandler(BaseHTTPRequestHandler):
+    """ JSON API over the inventories of an InventoryCache
+
+    GET /arrays                             arrays and their last refresh
+    GET /arrays/<SID>/<section>             objects of a section
+    GET /arrays/<SID>/<section>/<ID>        one object
+    GET /volumes/<ID>                       volume, SGs, views and hosts
+    GET /wwns/<WWN>                         volume or initiator of a WWN
+    GET /storage_groups/<name>              SG, volumes, views and hosts
+    GET /hosts/<name>                       IG, views, SGs and volumes
+    The lookups return a list, one item per array the object is found on.
+    """
+
+    lookups = {'volumes': MemoryInventory.volume,
+               'wwns': MemoryInventory.wwn,
+               'storage_groups': MemoryInventory.storage_group,
+               'hosts': MemoryInventory.host}
+
+    def do_GET(self):
+        cache = self.server.cache
+        parts = [unquote(part) for part in
+                 self.path.split('?')[0].strip('/').split('/')]
+
+        if parts == ['arrays']:
+            return self._send(200, [inventory.summary() for inventory
+                                    in cache.inventories()])
+
+        if parts[0] == 'arrays' and 3 <= len(parts) <= 4:
+            inventory = cache.get(parts[1])
+            if inventory is None or parts[2] not in inventory.sections:
+                return self._send(404, {'error': 'Unknown array or section'})
+            objects = inventory.sections[parts[2]]
+            if len(parts) == 3:
+                return self._send(200, list(objects.values()))
+            if parts[3] not in objects:
+                return self._send(404, {'error': 'Unknown object'})
+            return self._send(200, objects[parts[3]])
+
+        if parts[0] in self.lookups and len(parts) == 2:
+            lookup = self.lookups[parts[0]]
+            results = [lookup(inventory, parts[1])
+                       for inventory in cache.inventories()]
+            return self._send(200, [result for result in results
+                                    if result is not None])
+
+        return self._send(404, {'error': 'Unknown endpoint'})
+
+    def _send(self, status: int, data):
+        body = json.dumps(data, default=dict).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger('vmaxray').debug('%s - %s' % (
+            self.address_string(), format % args))
+
+
+class InventoryServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ HTTP server of the JSON API, one thread per request """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, cache: InventoryCache):
+        """Constructor
+        :param address: (host, port) to listen on
+        :param cache: inventories served
+        """
+        super().__init__(address, InventoryRequestHandler)
+        self.cache = cache
@@ -20,3 +20,53 @@ class VmaxIteratorError(Exception):
 class XlsFormatterError(Exception):
     def __init__(self, message):
         Exception.__init__(self, message)
+
+
+class PerfArchiveError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class SqliteFormatterError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class StreamFormatterError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class ColumnarFormatterError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class InventoryDiffError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class SnapshotArchiveError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class CapacityHistoryError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class WwnIndexError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class InventoryPipelineError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+class InventoryJournalError(Exception):
+    def __init__(self, message):
+        Exception.__init__(self, message)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import math
+import time
+from vmaxray.errors import VmaxIteratorError
+from vmaxray.scheduler import FleetScheduler
+from vmaxray.scope import Scope
+from vmaxray.vmax_iterators import SOURCES, PREFETCH
+from vmaxray.PyU4V.rest_univmax2 import RestFunctions
+
+__author__ = 'Julien B.'
+
+SAMPLE = 5  # objects requested per section to measure their cost
+TOTALS = ('objects', 'requests', 'bytes', 'seconds')
+
+
+class RequestMeter(object):
+    """ Count the requests sent through a connection, their time and size """
+
+    def __init__(self, request):
+        """Constructor
+        :param request: request function of the connection
+        """
+        self._request = request
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        message, status = self._request(*args, **kwargs)
+        self.seconds += time.perf_counter() - start
+        self.requests += 1
+        if isinstance(message, (dict, list)):
+            self.bytes += len(json.dumps(message))
+        return message, status
+
+
+def total(estimates: list, sid: str = 'fleet', addresses: dict = None,
+          scheduler: FleetScheduler = None):
+    """ Sum the estimates of several arrays
+
+    The time is the sum of the times of the arrays when they are collected
+    one after another, the time of the simulated run of the scheduler
+    otherwise.
+    :param estimates: estimates of the arrays (InventoryEstimator)
+    :param sid: name of the total
+    :param addresses: SID -> address of the UNISPHERE server of the arrays
+    :param scheduler: scheduler of the run (--parallel), None if sequential
+    """
+    result = {'sid': sid}
+    for key in TOTALS:
+        result[key] = sum(estimate[key] for estimate in estimates)
+    if scheduler is not None:
+        result['seconds'] = scheduler.makespan(
+            [(estimate['sid'], addresses[estimate['sid']],
+              estimate['seconds']) for estimate in estimates])
+    return result
+
+
+def describe(estimate: dict):
+    """ Return a line describing an estimate """
+    seconds = int(round(estimate['seconds']))
+    return ('%s: %d objects, %d requests, %.1f MB, %dh%02dm%02ds' %
+            (estimate['sid'], estimate['objects'], estimate['requests'],
+             estimate['bytes'] / 1e6, seconds // 3600, seconds // 60 % 60,
+             seconds % 60))
+
+
+class InventoryEstimator(object):
+    """ Estimate the cost of the inventory of an array, before running it
+
+    Only the lists of IDs are requested (for the TDEVs, the first page of
+    the list, giving their number), and the details of a few objects of
+    each section. The number of objects is multiplied by the latency and
+    the size measured on that sample.
+    """
+
+    def __init__(self, vmax: RestFunctions, scope: Scope = None,
+                 connections: int = 1, prefetch: int = PREFETCH,
+                 sample: int = SAMPLE):
+        """Constructor
+
+        :param vmax: connection to the array
+        :param scope: part of the array to inventory, the whole array if None
+        :param connections: connections requesting the TDEVs (--shards)
+        :param prefetch: requests in flight per connection
+        :param sample: objects requested per section
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._vmax = vmax.clone()  # the requests of the clone are metered
+        self._meter = RequestMeter(self._vmax.request)
+        self._vmax.request = self._meter
+        self._scope = scope if scope is not None else Scope()
+        self._connections = max(1, connections)
+        self._prefetch = max(1, prefetch)
+        self._sample = sample
+
+    def _list(self, section: str):
+        """ Return the number of objects, sample IDs and number of pages """
+        scope = self._scope
+        if section != 'volume' or scope.storage_groups or scope.srp or \
+                scope.volumes:
+            ids = list(scope.ids(self._vmax, section))
+            return len(ids), ids[:self._sample], 1
+
+        # The first page gives the number of TDEVs
+        filters = {'tdev': True}
+        if scope.mapped:
+            filters['mapped'] = 'true'
+        result = self._vmax.get_volumes(filters=filters)
+        if result[1] != 200:
+            msg = 'Error while executing the request: %s' % str(result)
+            self._logger.error(msg)
+            raise VmaxIteratorError(msg)
+        listing = result[0] or {}
+        count = listing.get('count', 0)
+        ids = [item['volumeId'] for item in
+               listing.get('resultList', {}).get('result', [])]
+        pages = 1
+        if 'id' in listing:
+            pages = math.ceil(count / listing.get('maxPageSize', 1000))
+        return count, ids[:self._sample], pages
+
+    def estimate(self):
+        """ Return the estimate of the inventory: dict of the totals of the
+        array (sid, objects, requests, bytes, seconds) and of each section
+        """
+        sections = {}
+        for section in SOURCES:
+            if not self._scope.includes(section):
+                continue
+            method = getattr(self._vmax, SOURCES[section][0])
+
+            self._meter.reset()
+            count, ids, pages = self._list(section)
+            listing = (self._meter.requests * pages,
+                       self._meter.bytes * pages, self._meter.seconds * pages)
+
+            self._meter.reset()
+            for object_id in ids:
+                method(object_id)
+            sampled = max(1, self._meter.requests)
+            latency = self._meter.seconds / sampled
+            size = self._meter.bytes / sampled
+
+            concurrency = self._prefetch
+            if section == 'volume':
+                concurrency *= self._connections
+            sections[section] = {
+                'objects': count, 'requests': listing[0] + count,
+                'bytes': int(listing[1] + count * size),
+                'seconds': listing[2] + count * latency / concurrency,
+                'latency': latency}
+
+        result = {'sid': self._vmax.array_id}
+        for key in TOTALS:
+            result[key] = sum(values[key] for values in sections.values())
+        result['sections'] = sections
+        self._vmax.close_session()
+        return result
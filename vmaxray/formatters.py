@@ -1,15 +1,87 @@
 #!/usr/bin/env python3
 # coding: utf-8
 
+import csv
+import gzip
+import json
 import os
 import logging
+import queue
+import sqlite3
+import threading
 import xlsxwriter
 from abc import ABCMeta
-from vmaxray.errors import XlsFormatterError
+from vmaxray.errors import XlsFormatterError, SqliteFormatterError, \
+    StreamFormatterError, InventoryPipelineError
 from vmaxray.xls_sheet import *
 
 __author__ = 'Julien B.'
 
+# Inventory sections: name of the section (add_<section> method of the
+# formatters) -> attribute identifying an object of that section
+SECTIONS = {'srp': 'srpId',
+            'volume': 'volumeId',
+            'initiator': 'initiatorId',
+            'masking_view': 'maskingViewId',
+            'initiator_group': 'hostId',
+            'initiator_cascaded_group': 'hostGroupId',
+            'port_group': 'portGroupId',
+            'storage_group': 'storageGroupId'}
+
+# Columns of each section: (scalar columns, list columns)
+COLUMNS = {
+    'srp': (['srpId', 'emulation', 'total_usable_cap_gb',
+             'total_subscribed_cap_gb', 'total_allocated_cap_gb',
+             'total_snapshot_allocated_cap_gb',
+             'effective_used_capacity_percent', 'vp_saved_percent',
+             'compression_overall_ratio_to_one',
+             'compression_vp_ratio_to_one'], []),
+    'volume': (['volumeId', 'wwn', 'effective_wwn', 'type', 'emulation',
+                'status', 'cap_gb', 'cap_mb', 'cap_cyl',
+                'allocated_percent', 'num_of_storage_groups',
+                'snapvx_source', 'snapvx_target'], ['storageGroupId']),
+    'initiator': (['initiatorId', 'alias', 'host', 'logged_in',
+                   'on_fabric', 'port_flags_override', 'flags_in_effect',
+                   'num_of_vols'], ['maskingview']),
+    'masking_view': (['maskingViewId', 'hostId', 'hostGroupId',
+                      'portGroupId', 'storageGroupId'], []),
+    'initiator_group': (['hostId', 'num_of_initiators', 'consistent_lun',
+                         'port_flags_override'],
+                        ['initiator', 'maskingview']),
+    'initiator_cascaded_group': (['hostGroupId', 'num_of_hosts',
+                                  'num_of_masking_views', 'consistent_lun',
+                                  'port_flags_override'],
+                                 ['host', 'maskingview']),
+    'port_group': (['portGroupId', 'num_of_ports', 'num_of_masking_views'],
+                   ['symmetrixPortKey', 'maskingview']),
+    'storage_group': (['storageGroupId', 'num_of_vols', 'cap_gb', 'VPSaved',
+                       'compressionRatio', 'device_emulation', 'srp',
+                       'type', 'slo', 'num_of_parent_sgs',
+                       'num_of_child_sgs', 'num_of_snapshots'],
+                      ['maskingview']),
+    'array': (['symmetrixId', 'model', 'ucode', 'device_count',
+               'host_visible_device_count', 'total_usable_cap_gb',
+               'total_subscribed_cap_gb', 'total_allocated_cap_gb',
+               'effective_used_capacity_percent', 'VP_saved_percent',
+               'default_fba_srp', 'compression_enabled',
+               'system_meta_data_used_percent'], []),
+    'rollup': (['group', 'date', 'metric', 'aggregate', 'value',
+                'samples'], []),
+    'forecast': (['sid', 'section', 'object', 'metric', 'samples',
+                  'last_value', 'growth_per_day', 'capacity', 'threshold',
+                  'days_left', 'date'], []),
+    'finding': (['sid', 'check', 'section', 'object', 'detail'], []),
+}
+
+
+def flatten_item(item):
+    """ Flatten the items of a list attribute (port keys, hosts...) """
+    if isinstance(item, dict) and 'hostId' in item:
+        return item['hostId']  # IG of a cascaded IG, as in the Excel sheet
+    if isinstance(item, dict):
+        return ':'.join(str(value) for value in item.values())
+    return item
+
 
 class Formatter(object, metaclass=ABCMeta):
     """ Abstract class Formatter
@@ -37,15 +109,29 @@ class Formatter(object, metaclass=ABCMeta):
     def add_masking_view(self, view_data):
         raise NotImplementedError
 
-    def add_thin_pool(self):
-        raise NotImplementedError
-
     def add_srp(self, srp_data):
         raise NotImplementedError
 
     def add_volume(self, vol_data):
         raise NotImplementedError
 
+    # Optional sections, ignored unless the formatter writes them
+
+    def add_thin_pool(self):
+        pass
+
+    def add_array(self, array_data):
+        pass
+
+    def add_rollup(self, rollup_data):
+        pass
+
+    def add_forecast(self, forecast_data):
+        pass
+
+    def add_finding(self, finding_data):
+        pass
+
     def close(self):
         raise NotImplementedError
 
@@ -112,5 +198,463 @@ class XlsFormatter(Formatter):
     def add_array(self, array_data):
         VmaxSheet(self._book).add_row(**array_data)
 
+    def add_rollup(self, rollup_data):
+        RollupSheet(self._book).add_row(**rollup_data)
+
+    def add_forecast(self, forecast_data):
+        ForecastSheet(self._book).add_row(**forecast_data)
+
+    def add_finding(self, finding_data):
+        AuditSheet(self._book).add_row(**finding_data)
+
     def close(self):
         self._book.close()
+        Singleton.release(self._book)
+
+
+class TeeFormatter(Formatter):
+    """ Send the data to several formatters """
+
+    def __init__(self, *formatters: Formatter):
+        """Constructor
+        :param formatters: Formatters receiving every row, in that order
+        """
+        super().__init__()
+        self._formatters = formatters
+
+    def add_volume(self, vol_data):
+        for formatter in self._formatters:
+            formatter.add_volume(vol_data)
+
+    def add_initiator_cascaded_group(self, init_data):
+        for formatter in self._formatters:
+            formatter.add_initiator_cascaded_group(init_data)
+
+    def add_storage_group(self, sg_data):
+        for formatter in self._formatters:
+            formatter.add_storage_group(sg_data)
+
+    def add_masking_view(self, view_data):
+        for formatter in self._formatters:
+            formatter.add_masking_view(view_data)
+
+    def add_thin_pool(self):
+        for formatter in self._formatters:
+            formatter.add_thin_pool()
+
+    def add_initiator_group(self, init_data):
+        for formatter in self._formatters:
+            formatter.add_initiator_group(init_data)
+
+    def add_initiator(self, init_data):
+        for formatter in self._formatters:
+            formatter.add_initiator(init_data)
+
+    def add_srp(self, srp_data):
+        for formatter in self._formatters:
+            formatter.add_srp(srp_data)
+
+    def add_port_group(self, pg_data):
+        for formatter in self._formatters:
+            formatter.add_port_group(pg_data)
+
+    def add_array(self, array_data):
+        for formatter in self._formatters:
+            formatter.add_array(array_data)
+
+    def add_rollup(self, rollup_data):
+        for formatter in self._formatters:
+            formatter.add_rollup(rollup_data)
+
+    def add_forecast(self, forecast_data):
+        for formatter in self._formatters:
+            formatter.add_forecast(forecast_data)
+
+    def add_finding(self, finding_data):
+        for formatter in self._formatters:
+            formatter.add_finding(finding_data)
+
+    def close(self):
+        for formatter in self._formatters:
+            formatter.close()
+
+
+class QueueFormatter(Formatter):
+    """ Send the data to a bounded queue, drained by another thread
+
+    Items are (name of the formatter method, arguments) tuples, closing puts
+    None. A full queue blocks the producer until the consumer catches up;
+    once the consumer is stopped, adding data raises InventoryPipelineError.
+    """
+
+    def __init__(self, records: queue.Queue, stopped: threading.Event):
+        """Constructor
+        :param records: Queue of the data
+        :param stopped: Event set when the consumer gives up
+        """
+        super().__init__()
+        self._records = records
+        self._stopped = stopped
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._records.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise InventoryPipelineError('The writer of the inventory stopped')
+
+    def add_volume(self, vol_data):
+        self._put(('add_volume', (vol_data,)))
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._put(('add_initiator_cascaded_group', (init_data,)))
+
+    def add_storage_group(self, sg_data):
+        self._put(('add_storage_group', (sg_data,)))
+
+    def add_masking_view(self, view_data):
+        self._put(('add_masking_view', (view_data,)))
+
+    def add_thin_pool(self):
+        self._put(('add_thin_pool', ()))
+
+    def add_initiator_group(self, init_data):
+        self._put(('add_initiator_group', (init_data,)))
+
+    def add_initiator(self, init_data):
+        self._put(('add_initiator', (init_data,)))
+
+    def add_srp(self, srp_data):
+        self._put(('add_srp', (srp_data,)))
+
+    def add_port_group(self, pg_data):
+        self._put(('add_port_group', (pg_data,)))
+
+    def add_array(self, array_data):
+        self._put(('add_array', (array_data,)))
+
+    def add_rollup(self, rollup_data):
+        self._put(('add_rollup', (rollup_data,)))
+
+    def add_forecast(self, forecast_data):
+        self._put(('add_forecast', (forecast_data,)))
+
+    def add_finding(self, finding_data):
+        self._put(('add_finding', (finding_data,)))
+
+    def close(self):
+        if not self._stopped.is_set():
+            self._put(None)
+
+
+class SqliteFormatter(Formatter):
+    """ Format the data under a SQLite database
+
+    Every section gets its own table, and every list attribute of a section
+    its own link table (<section>_<attribute>) with one row per item.
+    """
+
+    # Indexes built once every row is inserted
+    _indexes = [('volume', 'volumeId'),
+                ('volume', 'wwn'),
+                ('volume', 'effective_wwn'),
+                ('volume_storageGroupId', 'storageGroupId'),
+                ('volume_storageGroupId', 'volumeId'),
+                ('storage_group', 'storageGroupId'),
+                ('storage_group_maskingview', 'storageGroupId'),
+                ('masking_view', 'maskingViewId'),
+                ('masking_view', 'storageGroupId'),
+                ('masking_view', 'hostId'),
+                ('initiator', 'initiatorId'),
+                ('initiator', 'host'),
+                ('initiator_group', 'hostId'),
+                ('initiator_group_initiator', 'hostId'),
+                ('initiator_cascaded_group_host', 'host')]
+
+    def __init__(self, path: str, filename: str, batch_size: int = 5000):
+        """Constructor
+        :param path: Where create the inventory file
+        :param filename: Filename of that database
+        :param batch_size: Number of rows inserted per transaction
+        """
+        super().__init__()
+
+        if not os.path.isdir(path):
+            self._logger.error('Path incorrect (%s)' % path)
+            raise SqliteFormatterError('Path incorrect (%s)' % path)
+
+        if not os.access(path, os.W_OK):
+            self._logger.error('Insufficient rights on %s' % path)
+            raise SqliteFormatterError('Insufficient rights on %s' % path)
+
+        database = path + os.path.sep + filename
+        if os.path.isfile(database):
+            os.remove(database)
+
+        self._logger.info('Initializing a SQLite database (%s)' % filename)
+        self._db = sqlite3.connect(database)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._batch_size = batch_size
+        self._pending = {}  # table -> rows waiting to be inserted
+        self._queries = {}  # table -> insert query
+        self._create_tables()
+
+    def _create_tables(self):
+        for section, (columns, lists) in COLUMNS.items():
+            key = columns[0]
+            self._create_table(section, columns)
+            for attribute in lists:
+                self._create_table('%s_%s' % (section, attribute),
+                                   [key, attribute])
+        self._db.commit()
+
+    def _create_table(self, table: str, columns: list):
+        quoted = ', '.join('"%s"' % column for column in columns)
+        self._db.execute('CREATE TABLE "%s" (%s)' % (table, quoted))
+        self._queries[table] = 'INSERT INTO "%s" VALUES (%s)' % (
+            table, ', '.join('?' * len(columns)))
+        self._pending[table] = []
+
+    def _add(self, section: str, data: dict):
+        columns, lists = COLUMNS[section]
+        self._insert(section, [data.get(column) for column in columns])
+
+        key = data.get(columns[0])
+        for attribute in lists:
+            for item in data.get(attribute) or []:
+                self._insert('%s_%s' % (section, attribute),
+                             [key, flatten_item(item)])
+
+    def _insert(self, table: str, row: list):
+        pending = self._pending[table]
+        pending.append(row)
+        if len(pending) >= self._batch_size:
+            self._flush(table)
+
+    def _flush(self, table: str):
+        with self._db:
+            self._db.executemany(self._queries[table], self._pending[table])
+        self._pending[table] = []
+
+    def add_volume(self, vol_data):
+        self._add('volume', vol_data)
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._add('initiator_cascaded_group', init_data)
+
+    def add_storage_group(self, sg_data):
+        self._add('storage_group', sg_data)
+
+    def add_masking_view(self, view_data):
+        self._add('masking_view', view_data)
+
+    def add_initiator_group(self, init_data):
+        self._add('initiator_group', init_data)
+
+    def add_initiator(self, init_data):
+        self._add('initiator', init_data)
+
+    def add_srp(self, srp_data):
+        self._add('srp', srp_data)
+
+    def add_port_group(self, pg_data):
+        self._add('port_group', pg_data)
+
+    def add_array(self, array_data):
+        self._add('array', array_data)
+
+    def add_rollup(self, rollup_data):
+        self._add('rollup', rollup_data)
+
+    def add_forecast(self, forecast_data):
+        self._add('forecast', forecast_data)
+
+    def add_finding(self, finding_data):
+        self._add('finding', finding_data)
+
+    def close(self):
+        if self._db is None:
+            return
+
+        for table in self._pending:
+            self._flush(table)
+
+        self._logger.debug('Now indexing the database')
+        with self._db:
+            for table, column in self._indexes:
+                self._db.execute('CREATE INDEX "ix_%s_%s" ON "%s" ("%s")' %
+                                 (table, column, table, column))
+        self._db.execute('PRAGMA journal_mode = DELETE')
+        self._db.close()
+        self._db = None
+
+
+class StreamFormatter(Formatter):
+    """ Abstract class for the formatters writing rows as they arrive
+
+    Nothing is kept in memory: each row is written (and flushed) as soon as
+    it is received, so the files can be consumed while the inventory is
+    still running.
+    """
+
+    extension = None  # have to be overload by the child
+
+    def __init__(self, path: str, filename: str, split: bool = True,
+                 compress: bool = False, flush_every: int = 1000):
+        """Constructor
+        :param path: Where create the inventory files
+        :param filename: Name of the directory holding one file per section
+                         (split mode) or name of the single stream file
+        :param split: One file per section, or one stream for all sections
+        :param compress: Compress the files with gzip
+        :param flush_every: Rows written between two flushes of a gzip file
+        """
+        super().__init__()
+
+        if not os.path.isdir(path):
+            self._logger.error('Path incorrect (%s)' % path)
+            raise StreamFormatterError('Path incorrect (%s)' % path)
+
+        if not os.access(path, os.W_OK):
+            self._logger.error('Insufficient rights on %s' % path)
+            raise StreamFormatterError('Insufficient rights on %s' % path)
+
+        self._target = path + os.path.sep + filename
+        self._split = split
+        self._compress = compress
+        self._flush_every = flush_every
+        self._files = {}  # section -> [file, writer, rows since flush]
+
+        if split:
+            self._logger.info('Initializing a %s inventory (%s%s)' %
+                              (self.extension.upper(), filename, os.path.sep))
+            os.makedirs(self._target, exist_ok=True)
+        else:
+            self._logger.info('Initializing a %s inventory (%s)' %
+                              (self.extension.upper(), filename))
+
+    def _open(self, filename: str):
+        if self._compress:
+            return gzip.open(filename + '.gz', 'wt', newline='')
+        return open(filename, 'w', buffering=1, newline='')
+
+    def _get_file(self, section: str):
+        """ Open (once) the file receiving the rows of a section """
+        key = section if self._split else None
+        if key not in self._files:
+            if self._split:
+                filename = '%s%s%s.%s' % (self._target, os.path.sep,
+                                          section, self.extension)
+            else:
+                filename = self._target
+            stream = self._open(filename)
+            self._files[key] = [stream, self._writer(stream, section), 0]
+        return self._files[key]
+
+    def _writer(self, stream, section: str):
+        return stream
+
+    def _add(self, section: str, data: dict):
+        entry = self._get_file(section)
+        self._write(entry[1], section, data)
+        if self._compress:
+            entry[2] += 1
+            if entry[2] >= self._flush_every:
+                entry[0].flush()
+                entry[2] = 0
+
+    def _write(self, writer, section: str, data: dict):
+        raise NotImplementedError
+
+    def add_volume(self, vol_data):
+        self._add('volume', vol_data)
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._add('initiator_cascaded_group', init_data)
+
+    def add_storage_group(self, sg_data):
+        self._add('storage_group', sg_data)
+
+    def add_masking_view(self, view_data):
+        self._add('masking_view', view_data)
+
+    def add_initiator_group(self, init_data):
+        self._add('initiator_group', init_data)
+
+    def add_initiator(self, init_data):
+        self._add('initiator', init_data)
+
+    def add_srp(self, srp_data):
+        self._add('srp', srp_data)
+
+    def add_port_group(self, pg_data):
+        self._add('port_group', pg_data)
+
+    def add_array(self, array_data):
+        self._add('array', array_data)
+
+    def add_rollup(self, rollup_data):
+        self._add('rollup', rollup_data)
+
+    def add_forecast(self, forecast_data):
+        self._add('forecast', forecast_data)
+
+    def add_finding(self, finding_data):
+        self._add('finding', finding_data)
+
+    def close(self):
+        for stream, writer, rows in self._files.values():
+            stream.close()
+        self._files = {}
+
+
+class CsvFormatter(StreamFormatter):
+    """ Format the data under CSV files, one file per section
+
+    List attributes are written as comma separated values, like in the
+    Excel workbook.
+    """
+
+    extension = 'csv'
+
+    def __init__(self, path: str, filename: str, compress: bool = False,
+                 **kwargs):
+        # A CSV file has a single header: sections cannot share a stream
+        super().__init__(path, filename, split=True, compress=compress,
+                         **kwargs)
+
+    def _writer(self, stream, section: str):
+        columns, lists = COLUMNS[section]
+        writer = csv.writer(stream)
+        writer.writerow(columns + lists)
+        return writer
+
+    def _write(self, writer, section: str, data: dict):
+        columns, lists = COLUMNS[section]
+        row = [data.get(column) for column in columns]
+        for attribute in lists:
+            row.append(', '.join(str(flatten_item(item))
+                                 for item in data.get(attribute) or []))
+        writer.writerow(row)
+
+
+class JsonLinesFormatter(StreamFormatter):
+    """ Format the data under JSON Lines files
+
+    In split mode each line is a raw object of the section, in a single
+    stream each line is tagged: {"section": ..., "data": {...}}
+    """
+
+    extension = 'jsonl'
+
+    def _write(self, writer, section: str, data: dict):
+        # Records (vmaxray.models) are serialized as dicts
+        if self._split:
+            line = json.dumps(data, default=dict)
+        else:
+            line = json.dumps({'section': section, 'data': data},
+                              default=dict)
+        writer.write(line + '\n')
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import heapq
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from vmaxray.errors import VmaxIteratorError
+from vmaxray.perf_archive import PerfArchive
+from vmaxray.PyU4V.rest_univmax2 import RestFunctions
+
+__author__ = 'Julien B.'
+
+AGGREGATES = {'mean': lambda values: sum(values) / len(values),
+              'max': max,
+              'last': lambda values: values[-1]}
+
+
+class TopN(object):
+    """ Keep the N hottest objects per metric
+
+    Each series is reduced to a single value as soon as it is received and
+    only a bounded min-heap of N entries is kept per metric.
+    """
+
+    def __init__(self, count: int = 20, aggregate: str = 'mean'):
+        """Constructor
+
+        :param count: number of objects to keep per metric
+        :param aggregate: how a series is reduced (mean, max or last)
+        """
+        self._count = count
+        self._reduce = AGGREGATES[aggregate]
+        self._heaps = defaultdict(list)
+
+    def push(self, name: str, metric: str, value: float):
+        """ Offer the value of an object for a metric """
+        heap = self._heaps[metric]
+        if len(heap) < self._count:
+            heapq.heappush(heap, (value, name))
+        elif value > heap[0][0]:
+            heapq.heapreplace(heap, (value, name))
+
+    def add(self, name: str, perf_data: list, metrics=None):
+        """ Offer the series of an object
+
+        :param name: name of the object
+        :param perf_data: list of samples ({'timestamp': ..., metric: ...})
+        :param metrics: metrics to rank (all the metrics by default)
+        """
+        series = defaultdict(list)
+        for sample in perf_data:
+            for metric, value in sample.items():
+                if metric == 'timestamp' or value is None:
+                    continue
+                if metrics is None or metric in metrics:
+                    series[metric].append(value)
+
+        for metric, values in series.items():
+            self.push(name, metric, self._reduce(values))
+
+    def top(self, metric: str):
+        """ Return the (name, value) of the hottest objects, hottest first """
+        return [(name, value) for value, name in
+                sorted(self._heaps.get(metric, []), reverse=True)]
+
+    @property
+    def metrics(self):
+        return sorted(self._heaps)
+
+
+class HotObjectsReport(object):
+    """ Rank the storage groups or the hosts of an array """
+
+    def __init__(self, vmax: RestFunctions, scope: str = 'sg',
+                 workers: int = 8):
+        """Constructor
+
+        :param vmax: connection to the array
+        :param scope: sg (storage groups) or host
+        :param workers: number of concurrent metric requests
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._vmax = vmax
+        self._workers = workers
+        if scope == 'sg':
+            self._list_method, self._key = vmax.get_sg, 'storageGroupId'
+            self._metric_method = vmax.get_storage_group_metrics
+        elif scope == 'host':
+            self._list_method, self._key = vmax.get_hosts, 'hostId'
+            self._metric_method = vmax.get_host_metrics
+        else:
+            raise ValueError('Unknown scope %s' % scope)
+
+    def _get_names(self):
+        result = self._list_method()
+        if result[1] != 200:
+            msg = 'Error while executing the request: %s' % str(result)
+            self._logger.error(msg)
+            raise VmaxIteratorError(msg)
+        return result[0][self._key] if result[0] else []
+
+    def _fetch(self, name, start_date, end_date):
+        # An object without performance data (e.g. not registered for
+        # performance) makes the helper fail on the empty payload
+        try:
+            result = self._metric_method(name, start_date, end_date)
+        except (TypeError, KeyError, IndexError) as error:
+            result = None
+            self._logger.debug('No performance data for %s (%r)' %
+                               (name, error))
+        return name, result
+
+    def rank(self, start_date: int, end_date: int, metrics: list,
+             count: int = 20, aggregate: str = 'mean',
+             archive: PerfArchive = None):
+        """ Fetch the metrics of every object and keep the hottest ones
+
+        At most twice the number of workers results are in flight, each
+        one is folded into the heaps and dropped as soon as it arrives.
+        :param start_date: EPOCH Time in milliseconds
+        :param end_date: EPOCH Time in milliseconds
+        :param metrics: metrics to rank
+        :param count: number of objects to keep per metric
+        :param aggregate: how a series is reduced (mean, max or last)
+        :param archive: performance archive (opened in 'a' mode) receiving
+                        the series of every object, optional
+        :return: TopN
+        """
+        top = TopN(count=count, aggregate=aggregate)
+        names = iter(self._get_names())
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            while True:
+                for name in names:
+                    pending.add(pool.submit(self._fetch, name,
+                                            start_date, end_date))
+                    if len(pending) >= 2 * self._workers:
+                        break
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, result = future.result()
+                    if not result or result.get('perf_data') is None:
+                        self._logger.warning('No performance data for %s, '
+                                             'skipped' % name)
+                        continue
+                    top.add(name, result['perf_data'], metrics)
+                    if archive is not None:
+                        archive.append(name, result['perf_data'])
+
+        return top
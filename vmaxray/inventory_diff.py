@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import tempfile
+from collections import Counter
+from operator import itemgetter
+from vmaxray.errors import InventoryDiffError
+from vmaxray.formatters import SECTIONS
+
+__author__ = 'Julien B.'
+
+RUN_SIZE = 50000  # records sorted in memory per run of the external sort
+
+
+def read_section(snapshot: str, section: str):
+    """ Generator - Read the lines of a section of a JSON Lines snapshot
+
+    :param snapshot: directory written by JsonLinesFormatter (split mode)
+    :param section: name of the section (volume, storage_group...)
+    """
+    filename = '%s%s%s.jsonl' % (snapshot, os.path.sep, section)
+    if os.path.isfile(filename):
+        stream = open(filename)
+    elif os.path.isfile(filename + '.gz'):
+        stream = gzip.open(filename + '.gz', 'rt')
+    else:
+        return
+
+    with stream:
+        for line in stream:
+            if line.strip():
+                yield line
+
+
+class KeyReader(object):
+    """ Extract the key of a record without decoding the whole line """
+
+    def __init__(self, key: str):
+        self._key = key
+        self._pattern = re.compile(r'"%s": ("(?:[^"\\]|\\.)*")' % key)
+
+    def __call__(self, line: str):
+        match = self._pattern.search(line)
+        if not match:
+            return json.loads(line)[self._key]
+        value = match.group(1)
+        return value[1:-1] if '\\' not in value else json.loads(value)
+
+    def records(self, lines):
+        """ Generator - (key, line) tuples """
+        for line in lines:
+            yield self(line), line
+
+
+def _write_run(records: list, directory: str):
+    run = tempfile.NamedTemporaryFile('w', dir=directory, suffix='.jsonl',
+                                      delete=False)
+    with run:
+        run.writelines(line for key, line in records)
+    return run.name
+
+
+def _read_run(filename: str, key_reader: KeyReader):
+    with open(filename) as run:
+        yield from key_reader.records(run)
+
+
+def sorted_section(snapshot: str, section: str, key: str):
+    """ Generator - (key, line) tuples of a section sorted on their key
+
+    Unisphere returns most of the lists already sorted: the section is
+    streamed as is when it is, otherwise it goes through an external merge
+    sort (sorted runs of RUN_SIZE records in temporary files).
+    """
+    key_reader = KeyReader(key)
+    previous = None
+    for value, line in key_reader.records(read_section(snapshot, section)):
+        if previous is not None and value < previous:
+            break
+        previous = value
+    else:
+        yield from key_reader.records(read_section(snapshot, section))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        runs, records = [], []
+        for record in key_reader.records(read_section(snapshot, section)):
+            records.append(record)
+            if len(records) >= RUN_SIZE:
+                records.sort(key=itemgetter(0))
+                runs.append(_write_run(records, directory))
+                records = []
+        records.sort(key=itemgetter(0))
+        runs.append(_write_run(records, directory))
+        yield from heapq.merge(*[_read_run(run, key_reader) for run in runs],
+                               key=itemgetter(0))
+
+
+def _normalize(value):
+    """ Lists are compared regardless of the order of their items """
+    if isinstance(value, list):
+        return sorted(json.dumps(item, sort_keys=True) for item in value)
+    return value
+
+
+def compare_records(old: dict, new: dict):
+    """ Return the attributes that differ: {attribute: [old, new]} """
+    fields = {}
+    for attribute in sorted(set(old) | set(new)):
+        old_value, new_value = old.get(attribute), new.get(attribute)
+        if (old_value != new_value and
+                _normalize(old_value) != _normalize(new_value)):
+            fields[attribute] = [old_value, new_value]
+    return fields
+
+
+def diff_records(old_records, new_records):
+    """ Generator - Sorted-merge comparison of two sorted record streams
+
+    Records are (key, JSON line) tuples: lines are only decoded when they
+    differ.
+    :return: (change, key value, data) tuples where change is added,
+             removed or modified, data the record or the differing
+             attributes
+    """
+    old_records, new_records = iter(old_records), iter(new_records)
+    old, new = next(old_records, None), next(new_records, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield 'removed', old[0], json.loads(old[1])
+            old = next(old_records, None)
+        elif old is None or new[0] < old[0]:
+            yield 'added', new[0], json.loads(new[1])
+            new = next(new_records, None)
+        else:
+            if old[1] != new[1]:
+                fields = compare_records(json.loads(old[1]),
+                                         json.loads(new[1]))
+                if fields:
+                    yield 'modified', new[0], fields
+            old, new = next(old_records, None), next(new_records, None)
+
+
+class InventoryDiff(object):
+    """ Compare two inventory snapshots section by section """
+
+    def __init__(self, old: str, new: str):
+        """Constructor
+
+        :param old: directory of the old JSON Lines snapshot
+        :param new: directory of the new JSON Lines snapshot
+        """
+        self._logger = logging.getLogger('vmaxray')
+        for snapshot in (old, new):
+            if not os.path.isdir(snapshot):
+                self._logger.error('Unknown snapshot %s' % snapshot)
+                raise InventoryDiffError('Unknown snapshot %s' % snapshot)
+
+        self._old = old
+        self._new = new
+        self.summary = Counter()  # (section, change) -> count
+
+    def changes(self):
+        """ Generator - Changes of every section
+
+        :return: dicts {section, change, key, data}: the record for added
+                 and removed objects, the differing attributes
+                 ({attribute: [old, new]}) for modified ones
+        """
+        for section, key in SECTIONS.items():
+            old = sorted_section(self._old, section, key)
+            new = sorted_section(self._new, section, key)
+            for change, value, data in diff_records(old, new):
+                self.summary[section, change] += 1
+                yield {'section': section, 'change': change, 'key': value,
+                       'data': data}
+
+    def report(self, stream):
+        """ Write the changes as JSON Lines into a stream """
+        for change in self.changes():
+            stream.write(json.dumps(change) + '\n')
+
+        for (section, change), count in sorted(self.summary.items()):
+            self._logger.info('%-25s %-9s %d' % (section, change, count))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import os
+import sqlite3
+from vmaxray.errors import InventoryJournalError
+from vmaxray.scope import Scope
+
+__author__ = 'Julien B.'
+
+COMMIT_INTERVAL = 1000  # records journaled between two commits
+
+
+class InventoryJournal(object):
+    """ Checkpoints of the inventory of an array
+
+    The records are journaled in a SQLite database as they are collected,
+    in the order of the collection, and each section is marked once it is
+    complete. After an interruption, the collection is resumed from the
+    journal: the journaled records are replayed, only the missing objects
+    are requested. The journal is removed once the inventory is written.
+    The scope of the collection (with its sections) is journaled too: a
+    journal of another scope is discarded instead of being resumed.
+    """
+
+    _schema = ['CREATE TABLE IF NOT EXISTS journal (sid TEXT, scope TEXT)',
+               'CREATE TABLE IF NOT EXISTS sections ('
+               'section TEXT PRIMARY KEY, complete INTEGER)',
+               'CREATE TABLE IF NOT EXISTS records ('
+               'section TEXT, position INTEGER, data TEXT, '
+               'PRIMARY KEY (section, position)) WITHOUT ROWID']
+
+    def __init__(self, path: str, sid: str, resume: bool = False,
+                 scope: Scope = None):
+        """Constructor
+
+        :param path: SQLite database of the journal
+        :param sid: SID of the array
+        :param resume: resume from an existing journal (discarded otherwise)
+        :param scope: scope of the collection, the whole array if None
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        scope = str(scope if scope is not None else Scope())
+        journaled = self._open(sid, scope, resume)
+        if journaled is not None and journaled[0] != sid:
+            self._db.close()
+            self._logger.error('The journal %s belongs to %s' %
+                               (path, journaled[0]))
+            raise InventoryJournalError('The journal %s belongs to %s' %
+                                        (path, journaled[0]))
+        if journaled is not None and journaled[1] != scope:
+            self._db.close()
+            self._logger.warning('The journal %s was started for another '
+                                 'scope (%s), starting again' %
+                                 (path, journaled[1]))
+            self._open(sid, scope, resume=False)
+
+        self._positions = dict(self._db.execute(
+            'SELECT section, MAX(position) + 1 FROM records '
+            'GROUP BY section'))
+        self._pending = 0
+        if self._positions:
+            self._logger.info('Resuming from the journal %s (%d objects)' %
+                              (path, sum(self._positions.values())))
+
+    def _open(self, sid: str, scope: str, resume: bool):
+        """ Open the journal, return its (sid, scope) if it is resumed """
+        try:
+            if not resume and os.path.exists(self._path):
+                os.remove(self._path)
+            # Written by the requesting thread in the pipelined mode
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            with self._db:
+                for statement in self._schema:
+                    self._db.execute(statement)
+            journaled = self._db.execute(
+                'SELECT sid, scope FROM journal').fetchone()
+            if journaled is None:
+                self._db.execute('INSERT INTO journal VALUES (?, ?)',
+                                 (sid, scope))
+                self._db.commit()
+        except (OSError, sqlite3.Error) as error:
+            self._logger.error('Unable to open the journal %s (%s)' %
+                               (self._path, error))
+            raise InventoryJournalError('Unable to open the journal %s' %
+                                        self._path)
+        return journaled
+
+    def records(self, section: str):
+        """ Generator - journaled records of a section, in collection order
+        """
+        cursor = self._db.execute('SELECT data FROM records '
+                                  'WHERE section = ? ORDER BY position',
+                                  (section,))
+        for data, in cursor:
+            yield json.loads(data)
+
+    def complete(self, section: str):
+        """ Return True if the section was completely collected """
+        row = self._db.execute('SELECT complete FROM sections '
+                               'WHERE section = ?', (section,)).fetchone()
+        return bool(row and row[0])
+
+    def add(self, section: str, data):
+        """ Journal a record, committed every COMMIT_INTERVAL records """
+        position = self._positions.get(section, 0)
+        self._db.execute('INSERT INTO records VALUES (?, ?, ?)',
+                         (section, position,
+                          json.dumps(data, default=dict)))
+        self._positions[section] = position + 1
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def end_section(self, section: str):
+        """ Mark a section as complete """
+        self._db.execute('INSERT OR REPLACE INTO sections VALUES (?, 1)',
+                         (section,))
+        self.commit()
+
+    def commit(self):
+        self._db.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def remove(self):
+        """ Close and delete the journal, once the inventory is written """
+        self._db.close()
+        os.remove(self._path)
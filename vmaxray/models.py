@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+from collections.abc import Mapping
+
+__author__ = 'Julien B.'
+
+
+class SymbolTable(object):
+    """ Shared instances of the values repeated across the objects of an array
+
+    The same status, emulation or SG name (and the same list of SG names,
+    the same port key...) is stored once for the whole array, whatever the
+    number of objects using it; equal values are then the same object.
+    """
+
+    def __init__(self):
+        self._symbols = {}
+
+    def __len__(self):
+        return len(self._symbols)
+
+    def intern(self, value):
+        """ Return the shared instance of a value """
+        if isinstance(value, str):
+            return self._symbols.setdefault(value, value)
+        if isinstance(value, (list, dict)):
+            try:
+                key = self._key(value)
+            except TypeError:  # unhashable values, not shared
+                return value
+            if key not in self._symbols:
+                self._symbols[key] = self._build(value)
+            return self._symbols[key]
+        return value
+
+    def _key(self, value):
+        if isinstance(value, list):
+            return (list,) + tuple(self._key(item) for item in value)
+        if isinstance(value, dict):
+            return (dict,) + tuple((key, self._key(item))
+                                   for key, item in value.items())
+        hash(value)
+        return type(value), value
+
+    def _build(self, value):
+        if isinstance(value, list):
+            return [self.intern(item) for item in value]
+        if isinstance(value, dict):
+            return {self.intern(key): self.intern(item)
+                    for key, item in value.items()}
+        return value
+
+
+class Record(Mapping):
+    """ Abstract class for the objects of an inventory
+
+    The attributes of an object are stored in __slots__, parsed once from
+    the REST payload, instead of a dict per object. A record behaves like a
+    read-only dict (record['cap_gb'], record.get('wwn'), **record...), the
+    attributes missing from the payload are missing from the record too.
+    Attributes unknown to the model are kept aside (_extra).
+
+    The values of the low cardinality attributes and of the references to
+    other objects (_interned) are shared through the SymbolTable of the
+    array: lists are shared as well, so records are read-only.
+    """
+
+    __slots__ = ('_extra',)
+    _fields = frozenset()
+    _interned = frozenset()  # have to be overload by the child
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.__slots__)
+
+    @classmethod
+    def from_json(cls, data: dict, symbols: SymbolTable = None):
+        """ Create a record from the JSON payload of an object
+
+        :param data: payload of the object
+        :param symbols: symbol table of the array, optional
+        """
+        record = cls.__new__(cls)
+        extra = None
+        for key, value in data.items():
+            if key in cls._fields:
+                if symbols is not None and key in cls._interned:
+                    value = symbols.intern(value)
+                setattr(record, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        record._extra = extra
+        return record
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __iter__(self):
+        for key in self.__slots__:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self))
+
+
+class Volume(Record):
+    """ TDEV """
+    __slots__ = ('volumeId', 'type', 'emulation', 'ssid', 'status',
+                 'allocated_percent', 'cap_gb', 'cap_mb', 'cap_cyl',
+                 'reserved', 'pinned', 'physical_name', 'volume_identifier',
+                 'wwn', 'effective_wwn', 'has_effective_wwn',
+                 'encapsulated', 'encapsulated_wwn', 'num_of_storage_groups',
+                 'num_of_front_end_paths', 'storageGroupId',
+                 'symmetrixPortKey', 'snapvx_source', 'snapvx_target',
+                 'mobility_id_enabled')
+    _interned = frozenset({'type', 'emulation', 'status', 'storageGroupId',
+                           'symmetrixPortKey'})
+
+
+class StorageGroup(Record):
+    """ Storage Group """
+    __slots__ = ('storageGroupId', 'slo', 'base_slo_name', 'srp', 'workload',
+                 'slo_compliance', 'num_of_vols', 'num_of_child_sgs',
+                 'num_of_parent_sgs', 'num_of_masking_views',
+                 'num_of_snapshots', 'cap_gb', 'device_emulation', 'type',
+                 'unprotected', 'child_storage_group', 'parent_storage_group',
+                 'maskingview', 'hostIOLimit', 'compression',
+                 'compressionRatio', 'VPSaved', 'uuid')
+    _interned = frozenset({'slo', 'base_slo_name', 'srp', 'workload',
+                           'slo_compliance', 'device_emulation', 'type',
+                           'compression', 'child_storage_group',
+                           'parent_storage_group', 'maskingview'})
+
+
+class MaskingView(Record):
+    """ Masking View """
+    __slots__ = ('maskingViewId', 'hostId', 'hostGroupId', 'portGroupId',
+                 'storageGroupId')
+    _interned = frozenset({'hostId', 'hostGroupId', 'portGroupId',
+                           'storageGroupId'})
+
+
+class InitiatorGroup(Record):
+    """ Initiator Group (host) """
+    __slots__ = ('hostId', 'num_of_masking_views', 'num_of_initiators',
+                 'num_of_host_groups', 'port_flags_override',
+                 'consistent_lun', 'enabled_flags', 'disabled_flags', 'type',
+                 'initiator', 'maskingview', 'hostgroup', 'bw_limit')
+    _interned = frozenset({'type', 'enabled_flags', 'disabled_flags',
+                           'maskingview', 'hostgroup'})
+
+
+class InitiatorGroupCascaded(Record):
+    """ Cascaded Initiator Group (host group) """
+    __slots__ = ('hostGroupId', 'num_of_hosts', 'num_of_initiators',
+                 'num_of_masking_views', 'port_flags_override',
+                 'consistent_lun', 'enabled_flags', 'disabled_flags', 'type',
+                 'host', 'maskingview')
+    _interned = frozenset({'type', 'enabled_flags', 'disabled_flags', 'host',
+                           'maskingview'})
+
+
+class Initiator(Record):
+    """ Initiator """
+    __slots__ = ('initiatorId', 'symmetrixPortKey', 'alias', 'type', 'fcid',
+                 'fcid_value', 'fcid_lockdown', 'ip_address', 'host',
+                 'hostGroup', 'logged_in', 'on_fabric', 'port_flags_override',
+                 'enabled_flags', 'disabled_flags', 'flags_in_effect',
+                 'num_of_vols', 'num_of_host_groups', 'num_of_masking_views',
+                 'maskingview', 'powerpathhosts', 'num_of_powerpath_hosts')
+    _interned = frozenset({'symmetrixPortKey', 'type', 'host', 'hostGroup',
+                           'enabled_flags', 'disabled_flags',
+                           'flags_in_effect', 'maskingview'})
+
+
+class PortGroup(Record):
+    """ Port Group """
+    __slots__ = ('portGroupId', 'num_of_ports', 'num_of_masking_views',
+                 'type', 'symmetrixPortKey', 'maskingview')
+    _interned = frozenset({'type', 'symmetrixPortKey', 'maskingview'})
+
+
+class SRP(Record):
+    """ Storage Resource Pool """
+    __slots__ = ('srpId', 'emulation', 'description', 'num_of_disk_groups',
+                 'diskGroupId', 'total_usable_cap_gb',
+                 'total_subscribed_cap_gb', 'total_allocated_cap_gb',
+                 'total_snapshot_allocated_cap_gb',
+                 'total_srdf_dse_allocated_cap_gb', 'reserved_cap_percent',
+                 'effective_used_capacity_percent', 'vp_saved_percent',
+                 'compression_overall_ratio_to_one',
+                 'compression_vp_ratio_to_one', 'rdfa_dse')
+    _interned = frozenset({'emulation', 'diskGroupId'})
@@ -5,6 +5,7 @@ import configparser
 import logging
 import os
 from vmaxray.errors import ConfigurationError
+from vmaxray.scope import Scope, parse_ranges, parse_sections
 
 
 class ConfigFileParser(object):
@@ -55,6 +56,13 @@ class ConfigFileParser(object):
                     self._logger.error('%s item cannot be empty' % value)
                     raise ConfigurationError
 
+            try:
+                self.get_scope(section)
+            except (ConfigurationError, ValueError) as error:
+                self._logger.error('%s in %s section' % (error, section))
+                raise ConfigurationError('%s in %s section' %
+                                         (error, section))
+
     def get_arrays(self):
         """ Generator - Extract the configuration items from the configuration """
 
@@ -64,3 +72,17 @@ class ConfigFileParser(object):
             password = self._config[section]['password']
 
             yield section, address, user, password
+
+    def get_scope(self, sid: str):
+        """ Return the scope of the inventory of an array (optional items)
+        """
+        config = self._config[sid]
+        sections = (parse_sections(config['sections'])
+                    if config.get('sections') else None)
+        storage_groups = [pattern.strip() for pattern
+                          in config.get('storage_groups', '').split(',')
+                          if pattern.strip()]
+        return Scope(sections=sections, storage_groups=storage_groups,
+                     srp=config.get('srp') or None,
+                     volumes=parse_ranges(config.get('volumes', '')),
+                     mapped=config.getboolean('mapped', fallback=False))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import json
+import logging
+import mmap
+import os
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from vmaxray.errors import PerfArchiveError
+from vmaxray.rollup import RESULT_KEYS
+
+__author__ = 'Julien B.'
+
+TIMESTAMP = 'timestamp'
+CHUNKS_FILE = 'chunks.bin'
+INDEX_FILE = 'index.jsonl'
+
+
+class PerfArchive(object):
+    """ On-disk store of performance time series
+
+    An archive is a directory holding two append-only files:
+    - chunks.bin: zlib compressed columns, one timestamp column (int64) and
+      one column per metric (float64, NaN when missing) for every chunk
+    - index.jsonl: one line per chunk with its object, time range and the
+      position of each of its columns inside chunks.bin
+
+    Reads memory-map chunks.bin and only decompress the timestamp and
+    metric columns of the chunks overlapping the requested time range.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        """Constructor
+
+        :param path: directory of the archive
+        :param mode: 'r' to read an archive, 'a' to create or append to it
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        self._mode = mode
+        self._index = {}  # object name -> list of chunks, sorted by start
+        self._map = None
+
+        if mode == 'a':
+            try:
+                os.makedirs(path, exist_ok=True)
+                self._chunks = open(os.path.join(path, CHUNKS_FILE), 'ab')
+                self._index_file = open(os.path.join(path, INDEX_FILE), 'a')
+            except OSError as error:
+                self._logger.error('Unable to open the performance archive '
+                                   '%s (%s)' % (path, error))
+                raise PerfArchiveError('Unable to open the performance '
+                                       'archive %s' % path)
+        elif mode != 'r':
+            raise ValueError('Unknown mode %s' % mode)
+        elif not os.path.isdir(path):
+            self._logger.error('Unknown performance archive %s' % path)
+            raise PerfArchiveError('Unknown performance archive %s' % path)
+
+        self._load_index()
+
+    def _load_index(self):
+        index_path = os.path.join(self._path, INDEX_FILE)
+        if not os.path.isfile(index_path):
+            return
+        with open(index_path) as index_file:
+            for line in index_file:
+                if line.strip():
+                    self._add_entry(json.loads(line))
+
+    def _add_entry(self, entry: dict):
+        entries = self._index.setdefault(entry['object'], [])
+        entries.append(entry)
+        if len(entries) > 1 and entries[-2]['start'] > entry['start']:
+            entries.sort(key=lambda item: item['start'])
+
+    def _write_column(self, column: array):
+        data = zlib.compress(column.tobytes())
+        offset = self._chunks.tell()
+        self._chunks.write(data)
+        return [offset, len(data)]
+
+    def append(self, name: str, perf_data: list):
+        """ Append the samples of an object as a new chunk
+
+        :param name: name of the object (SG, host, port...)
+        :param perf_data: list of samples ({'timestamp': ..., metric: ...})
+        """
+        if self._mode != 'a':
+            raise PerfArchiveError('Archive %s is read-only' % self._path)
+        if not perf_data:
+            return
+
+        samples = sorted(perf_data, key=lambda sample: sample[TIMESTAMP])
+        metrics = sorted({metric for sample in samples for metric in sample
+                          if metric != TIMESTAMP})
+
+        self._chunks.seek(0, os.SEEK_END)
+        columns = {TIMESTAMP: self._write_column(
+            array('q', [sample[TIMESTAMP] for sample in samples]))}
+        for metric in metrics:
+            values = [sample.get(metric) for sample in samples]
+            columns[metric] = self._write_column(array(
+                'd', [float('nan') if value is None else value
+                      for value in values]))
+        self._chunks.flush()
+
+        # The index line is written last: a chunk is only visible once it
+        # is completely on disk
+        entry = {'object': name,
+                 'start': samples[0][TIMESTAMP],
+                 'end': samples[-1][TIMESTAMP],
+                 'count': len(samples),
+                 'columns': columns}
+        self._index_file.write(json.dumps(entry) + '\n')
+        self._index_file.flush()
+        self._add_entry(entry)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def append_result(self, result: dict):
+        """ Append the result of a RestFunctions performance helper """
+        name = result[RESULT_KEYS[result['reporting_level']]]
+        self.append(name, result['perf_data'])
+
+    def objects(self):
+        return sorted(self._index)
+
+    def metrics(self, name: str):
+        return sorted({metric for entry in self._index.get(name, [])
+                       for metric in entry['columns'] if metric != TIMESTAMP})
+
+    def _read_column(self, position: list, typecode: str):
+        if self._map is None:
+            if self._mode == 'a':
+                self._chunks.flush()
+            with open(os.path.join(self._path, CHUNKS_FILE), 'rb') as chunks:
+                self._map = mmap.mmap(chunks.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        offset, length = position
+        column = array(typecode)
+        column.frombytes(zlib.decompress(self._map[offset:offset + length]))
+        return column
+
+    def read(self, name: str, metric: str, start: int = None,
+             end: int = None):
+        """ Read the series of an object metric
+
+        :param name: name of the object
+        :param metric: name of the metric
+        :param start: EPOCH Time in milliseconds, optional
+        :param end: EPOCH Time in milliseconds, optional
+        :return: timestamps (array of int64), values (array of float64)
+        """
+        timestamps, values = array('q'), array('d')
+        for entry in self._index.get(name, []):
+            if metric not in entry['columns']:
+                continue
+            if start is not None and entry['end'] < start:
+                continue
+            if end is not None and entry['start'] > end:
+                break
+
+            stamps = self._read_column(entry['columns'][TIMESTAMP], 'q')
+            column = self._read_column(entry['columns'][metric], 'd')
+            low = 0 if start is None else bisect_left(stamps, start)
+            high = len(stamps) if end is None else bisect_right(stamps, end)
+            timestamps.extend(stamps[low:high])
+            values.extend(column[low:high])
+
+        return timestamps, values
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._mode == 'a':
+            self._chunks.close()
+            self._index_file.close()
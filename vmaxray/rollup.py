@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import csv
+import logging
+import time
+from array import array
+from collections import defaultdict
+
+__author__ = 'Julien B.'
+
+HOUR = 3600000  # Unisphere timestamps are EPOCH milliseconds
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+# Key holding the object name in the results of the RestFunctions helpers
+RESULT_KEYS = {'StorageGroup': 'sgname',
+               'Host': 'HostID',
+               'PortGroup': 'pgname',
+               'array': 'symmetrixID'}
+
+ROLLUP_FIELDS = ['group', 'date', 'metric', 'aggregate', 'value', 'samples']
+
+
+def percentile(values: list, rank: float):
+    """ Percentile of a sorted list (linear interpolation between ranks)
+
+    :param values: sorted list of values
+    :param rank: percentile wanted, between 0 and 100
+    """
+    position = (len(values) - 1) * rank / 100.0
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class PerfRollup(object):
+    """ Grouped aggregations over collected performance data
+
+    Samples are stored per metric in typed arrays (object code, timestamp,
+    value). An aggregation does a single pass over these arrays to split
+    them by (group, time bucket), then each group is reduced with the C
+    implemented builtins (sum, max, min, sorted).
+    """
+
+    def __init__(self, bucket: int = DAY, groups=None):
+        """Constructor
+
+        :param bucket: size of the time buckets in milliseconds
+        :param groups: dict or function mapping an object name to its group
+                       (e.g. SG -> SRP, port -> director). Objects are
+                       their own group by default.
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._bucket = bucket
+        self._groups = groups
+        self._objects = {}  # object name -> object code
+        self._names = []    # object code -> object name
+        self._columns = {}  # metric -> (codes, timestamps, values)
+
+    def _code(self, name: str):
+        if name not in self._objects:
+            self._objects[name] = len(self._names)
+            self._names.append(name)
+        return self._objects[name]
+
+    def _group(self, name: str):
+        if self._groups is None:
+            return name
+        if callable(self._groups):
+            return self._groups(name)
+        return self._groups.get(name, name)
+
+    def add(self, name: str, perf_data: list):
+        """ Add the samples of one object
+
+        :param name: name of the object (SG, host, port...)
+        :param perf_data: list of samples ({'timestamp': ..., metric: ...})
+        """
+        code = self._code(name)
+        for sample in perf_data:
+            timestamp = sample['timestamp']
+            for metric, value in sample.items():
+                if metric == 'timestamp' or value is None:
+                    continue
+                if metric not in self._columns:
+                    self._columns[metric] = (array('L'), array('q'),
+                                             array('d'))
+                codes, timestamps, values = self._columns[metric]
+                codes.append(code)
+                timestamps.append(timestamp)
+                values.append(value)
+
+    def add_result(self, result: dict):
+        """ Add the result of a RestFunctions performance helper
+
+        :param result: result of get_storage_group_metrics,
+                       get_host_metrics, get_port_group_metrics,
+                       get_array_metrics or get_fe_port_util_sweep
+        """
+        level = result['reporting_level']
+        if level == 'FEPort' and 'ports' in result:
+            self.add_sweep(result)
+        elif level == 'FEDirector':
+            for director in result['perf_data']:
+                self.add(director['directorID'], director['perfdata'])
+        elif level in RESULT_KEYS:
+            self.add(result[RESULT_KEYS[level]], result['perf_data'])
+        else:
+            self._logger.warning('Unsupported performance result (%s)' %
+                                 level)
+
+    def add_sweep(self, sweep: dict):
+        """ Add a port x time matrix of get_fe_port_util_sweep """
+        timestamps = sweep['timestamps']
+        for metric, rows in sweep['perf_data'].items():
+            if metric not in self._columns:
+                self._columns[metric] = (array('L'), array('q'), array('d'))
+            codes, stamps, values = self._columns[metric]
+            for port, row in zip(sweep['ports'], rows):
+                code = self._code(port)
+                for timestamp, value in zip(timestamps, row):
+                    if value is not None:
+                        codes.append(code)
+                        stamps.append(timestamp)
+                        values.append(value)
+
+    @property
+    def metrics(self):
+        return sorted(self._columns)
+
+    def __len__(self):
+        return sum(len(column[2]) for column in self._columns.values())
+
+    def _split(self, metric: str):
+        """ Split the samples of a metric by (group, bucket) """
+        if metric not in self._columns:
+            return {}
+
+        group_codes = [self._group(name) for name in self._names]
+        bucket = self._bucket
+        buckets = defaultdict(lambda: array('d'))
+        codes, timestamps, values = self._columns[metric]
+        for code, timestamp, value in zip(codes, timestamps, values):
+            buckets[group_codes[code], timestamp - timestamp % bucket].append(
+                value)
+        return buckets
+
+    def aggregate(self, metric: str, aggregate: str = 'mean'):
+        """ Aggregate a metric by group and time bucket
+
+        :param metric: name of the metric (e.g. ResponseTime)
+        :param aggregate: mean, max, min, sum, count, p<rank> (e.g. p95)
+                          or rate (change of the bucket mean from the
+                          previous bucket of the same group)
+        :return: list of rows (dict) sorted by group and bucket
+        """
+        if aggregate == 'rate':
+            return self._rate(metric)
+
+        if aggregate.startswith('p'):
+            rank = float(aggregate[1:])
+            reduce = lambda values: percentile(sorted(values), rank)
+        else:
+            reduce = {'mean': lambda values: sum(values) / len(values),
+                      'max': max,
+                      'min': min,
+                      'sum': sum,
+                      'count': len}[aggregate]
+
+        rows = []
+        for (group, start), values in sorted(self._split(metric).items()):
+            rows.append(self._row(group, start, metric, aggregate,
+                                  reduce(values), len(values)))
+        return rows
+
+    def _rate(self, metric: str):
+        rows = []
+        previous = {}
+        for row in self.aggregate(metric, 'mean'):
+            group = row['group']
+            if group in previous:
+                rows.append(self._row(group, row['bucket'], metric, 'rate',
+                                      row['value'] - previous[group],
+                                      row['samples']))
+            previous[group] = row['value']
+        return rows
+
+    @staticmethod
+    def _row(group, start, metric, aggregate, value, samples):
+        return {'group': group,
+                'bucket': start,
+                'date': time.strftime('%Y-%m-%d %H:%M',
+                                      time.gmtime(start / 1000)),
+                'metric': metric,
+                'aggregate': aggregate,
+                'value': value,
+                'samples': samples}
+
+
+def port_director(port: str):
+    """ Group function mapping an FE port (FA-1D:4) to its director """
+    return port.split(':')[0]
+
+
+def export_csv(rows: list, path: str):
+    """ Write the rows of PerfRollup.aggregate into a CSV file """
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=ROLLUP_FIELDS,
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def export_formatter(rows: list, formatter):
+    """ Send the rows of PerfRollup.aggregate to a Formatter """
+    for row in rows:
+        formatter.add_rollup(row)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+__author__ = 'Julien B.'
+
+
+class RunStatistics(object):
+    """ Number of objects and duration of the last inventory of each array
+
+    Kept in a JSON file, used to schedule the next run.
+    """
+
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: JSON file of the statistics (created if needed)
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        self._lock = threading.Lock()  # arrays may be collected in parallel
+        try:
+            with open(path) as stats:
+                self._arrays = json.load(stats)
+        except (OSError, ValueError):
+            self._arrays = {}
+
+    def objects(self):
+        """ Return the number of objects of the last inventory of each array
+        """
+        return {sid: stats['objects'] for sid, stats in self._arrays.items()}
+
+    def record(self, sid: str, objects: int, seconds: float):
+        """ Record the last inventory of an array """
+        with self._lock:
+            self._arrays[sid] = {'objects': objects,
+                                 'seconds': round(seconds, 1)}
+            temporary = self._path + '.tmp'
+            try:
+                with open(temporary, 'w') as stats:
+                    json.dump(self._arrays, stats, indent=1, sort_keys=True)
+                os.replace(temporary, self._path)
+            except OSError as error:
+                self._logger.warning('Unable to write the statistics %s (%s)'
+                                     % (self._path, error))
+
+
+class FleetScheduler(object):
+    """ Inventory a fleet of arrays, several at once
+
+    The arrays are grouped by UNISPHERE server (address), and no server
+    inventories more than budget arrays at a time. Each worker takes, among
+    the servers under budget, the biggest array left (by number of objects
+    of the previous run, the arrays never inventoried first), so the long
+    inventories start early and the free workers go to any server that has
+    work left.
+    """
+
+    def __init__(self, budget: int, workers: int = None, sizes: dict = None):
+        """Constructor
+
+        :param budget: maximum number of arrays inventoried per server
+        :param workers: maximum number of arrays inventoried at once
+        (budget * number of servers by default)
+        :param sizes: SID -> number of objects of the previous run
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._budget = max(1, budget)
+        self._workers = workers
+        self._sizes = sizes or {}
+
+    def _size(self, sid: str):
+        # Unknown arrays first: they may be the biggest ones
+        return self._sizes.get(sid, float('inf'))
+
+    def makespan(self, arrays: list):
+        """ Return the time the inventory of the arrays would take
+
+        The run is simulated with the same rules, from the expected
+        duration of each array.
+        :param arrays: (SID, address, seconds) of the arrays
+        """
+        servers = {}  # address -> arrays left, the biggest last
+        for array in arrays:
+            servers.setdefault(array[1], []).append(array)
+        for queue in servers.values():
+            queue.sort(key=lambda array: self._size(array[0]))
+        running = {address: 0 for address in servers}
+        workers = self._workers or self._budget * len(servers)
+        finishing = []  # (end, address) of the running inventories
+        now = 0.0
+        while True:
+            ready = [address for address, queue in servers.items()
+                     if queue and running[address] < self._budget]
+            if ready and len(finishing) < workers:
+                address = max(ready, key=lambda address: self._size(
+                    servers[address][-1][0]))
+                array = servers[address].pop()
+                running[address] += 1
+                heapq.heappush(finishing, (now + array[2], address))
+                continue
+            if not finishing:
+                return now
+            now, address = heapq.heappop(finishing)
+            running[address] -= 1
+
+    def run(self, arrays: list, inventory):
+        """ Inventory the arrays
+
+        The first error (exception raised by inventory, SystemExit
+        included) stops the scheduling of new arrays; it is raised once
+        the running inventories are over.
+        :param arrays: (SID, address, user, password) of the arrays
+        :param inventory: function inventorying an array, called with the
+        items of arrays
+        """
+        servers = {}  # address -> arrays left, the biggest last
+        for array in arrays:
+            servers.setdefault(array[1], []).append(array)
+        for queue in servers.values():
+            queue.sort(key=lambda array: self._size(array[0]))
+        running = {address: 0 for address in servers}
+        errors = []
+        condition = threading.Condition()
+
+        def work():
+            while True:
+                with condition:
+                    while True:
+                        if errors:
+                            return
+                        ready = [address for address, queue in servers.items()
+                                 if queue and running[address] < self._budget]
+                        if ready:
+                            break
+                        if not any(servers.values()):
+                            return
+                        condition.wait()
+                    address = max(ready, key=lambda address: self._size(
+                        servers[address][-1][0]))
+                    array = servers[address].pop()
+                    running[address] += 1
+
+                try:
+                    inventory(*array)
+                except BaseException as error:
+                    errors.append(error)
+                with condition:
+                    running[address] -= 1
+                    condition.notify_all()
+
+        workers = self._workers or self._budget * len(servers)
+        threads = [threading.Thread(target=work, name='vmaxray-array-%d' % i)
+                   for i in range(min(workers, len(arrays)))]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._logger.info('%d arrays on %d servers inventoried in %.1fs' %
+                          (len(arrays), len(servers), time.time() - start))
+        if errors:
+            raise errors[0]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import logging
+from vmaxray.errors import ConfigurationError
+from vmaxray.vmax_iterators import SOURCES, list_ids
+from vmaxray.PyU4V.rest_univmax2 import RestFunctions
+
+__author__ = 'Julien B.'
+
+
+def parse_ranges(value: str):
+    """ Parse volume ID ranges: '00100-001FF, 00300' -> [(256, 511), ...]
+    """
+    ranges = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        try:
+            ranges.append((int(first, 16), int(last or first, 16)))
+        except ValueError:
+            raise ConfigurationError('Invalid volume range %s' % item)
+    return ranges
+
+
+def parse_sections(value: str):
+    """ Parse a list of sections: 'volume, storage_group' """
+    sections = [item.strip() for item in value.split(',') if item.strip()]
+    for section in sections:
+        if section not in SOURCES:
+            raise ConfigurationError('Unknown section %s (%s)' %
+                                     (section, ', '.join(SOURCES)))
+    return sections
+
+
+class Scope(object):
+    """ Part of an array to inventory
+
+    The scope is pushed down to UNISPHERE as query filters, so that only the
+    objects in scope are listed and requested:
+    - storage groups: names containing one of the patterns, in the SRP
+    - volumes: in those storage groups, mapped only, in the ID ranges (the
+      ranges filter the IDs of the listing, before the details are requested)
+    - SRP: the given one
+    - sections: the sections to inventory, all of them by default
+    The other sections are not narrowed by the storage groups.
+    """
+
+    def __init__(self, sections: list = None, storage_groups: list = None,
+                 srp: str = None, volumes: list = None, mapped: bool = False):
+        """Constructor
+
+        :param sections: sections to inventory (all of them if None)
+        :param storage_groups: patterns of the storage group names
+        :param srp: name of the SRP
+        :param volumes: volume ID ranges, (first, last) integers
+        :param mapped: only the mapped volumes
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self.sections = sections
+        self.storage_groups = storage_groups or []
+        self.srp = srp
+        self.volumes = volumes or []
+        self.mapped = mapped
+
+    def __bool__(self):
+        return bool(self.sections is not None or self.storage_groups or
+                    self.srp or self.volumes or self.mapped)
+
+    def __str__(self):
+        items = []
+        if self.sections is not None:
+            items.append('sections %s' % ','.join(self.sections))
+        if self.storage_groups:
+            items.append('SGs %s' % ','.join(self.storage_groups))
+        if self.srp:
+            items.append('SRP %s' % self.srp)
+        if self.volumes:
+            items.append('volumes %s' % ','.join(
+                '%05X-%05X' % volumes for volumes in self.volumes))
+        if self.mapped:
+            items.append('mapped volumes')
+        return ', '.join(items) if items else 'whole array'
+
+    def merge(self, other: 'Scope'):
+        """ Return this scope overridden by the options set in another one """
+        return Scope(sections=(other.sections if other.sections is not None
+                               else self.sections),
+                     storage_groups=other.storage_groups or
+                     self.storage_groups,
+                     srp=other.srp or self.srp,
+                     volumes=other.volumes or self.volumes,
+                     mapped=other.mapped or self.mapped)
+
+    def includes(self, section: str):
+        return self.sections is None or section in self.sections
+
+    def ids(self, vmax: RestFunctions, section: str):
+        """ List the IDs of the objects of a section in scope
+
+        :param vmax: connection to the array
+        :param section: name of the section (volume, storage_group...)
+        :return: iterable of the IDs
+        """
+        if not self.includes(section):
+            return []
+        if section == 'storage_group':
+            return self._storage_groups(vmax)
+        if section == 'volume':
+            return self._volumes(vmax)
+        if section == 'srp' and self.srp:
+            return [srp for srp in list_ids(vmax, 'srp') if srp == self.srp]
+        return list_ids(vmax, section)
+
+    def _storage_groups(self, vmax: RestFunctions):
+        if not (self.storage_groups or self.srp):
+            return list_ids(vmax, 'storage_group')
+
+        storage_groups = set()
+        for pattern in self.storage_groups or [None]:
+            filters = {}
+            if pattern:
+                filters['storageGroupId'] = '<like>%s' % pattern
+            if self.srp:
+                filters['srp_name'] = self.srp
+            storage_groups.update(list_ids(vmax, 'storage_group', filters))
+        return sorted(storage_groups)
+
+    def _volumes(self, vmax: RestFunctions):
+        filters = {'mapped': 'true'} if self.mapped else {}
+        if self.storage_groups or self.srp:
+            volumes = set()
+            for storage_group in self._storage_groups(vmax):
+                volumes.update(list_ids(vmax, 'volume',
+                                        dict(filters,
+                                             storageGroupId=storage_group)))
+            volumes = sorted(volumes)
+        else:
+            volumes = list_ids(vmax, 'volume', filters)
+
+        if not self.volumes:
+            return volumes
+        return (volume for volume in volumes if self._in_ranges(volume))
+
+    def _in_ranges(self, volume: str):
+        number = int(volume, 16)
+        return any(first <= number <= last for first, last in self.volumes)
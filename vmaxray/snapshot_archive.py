@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from vmaxray.errors import SnapshotArchiveError
+from vmaxray.formatters import Formatter
+
+__author__ = 'Julien B.'
+
+PACK_FILE = 'objects.pack'
+INDEX_FILE = 'objects.idx'
+MANIFESTS = 'manifests'
+INDEX_RECORD = struct.Struct('>20sQI')  # sha1 digest, offset, length
+
+
+class SnapshotArchive(object):
+    """ Deduplicated archive of inventory snapshots
+
+    Every object record is stored once, keyed by the SHA-1 of its section
+    and content, in an append-only pack file (objects.pack, zlib compressed
+    JSON) indexed by objects.idx. A snapshot is a manifest listing the
+    section and digest of each of its records, in the order they were
+    collected: manifests/<SID>/<date>.manifest.gz
+    """
+
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: directory of the archive (created if needed)
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        self._lock = threading.Lock()
+        self._objects = {}  # digest -> (offset, length)
+        self._pending = []  # index records not written yet
+
+        try:
+            os.makedirs(os.path.join(path, MANIFESTS), exist_ok=True)
+            self._load_index()
+            self._pack = open(os.path.join(path, PACK_FILE), 'a+b')
+            self._index = open(os.path.join(path, INDEX_FILE), 'ab')
+        except OSError as error:
+            self._logger.error('Unable to open the archive %s (%s)' %
+                               (path, error))
+            raise SnapshotArchiveError('Unable to open the archive %s' % path)
+
+    def _load_index(self):
+        index_path = os.path.join(self._path, INDEX_FILE)
+        if not os.path.isfile(index_path):
+            return
+        with open(index_path, 'rb') as index_file:
+            data = index_file.read()
+        # A truncated last record (interrupted write) is ignored
+        size = len(data) - len(data) % INDEX_RECORD.size
+        for digest, offset, length in INDEX_RECORD.iter_unpack(data[:size]):
+            self._objects[digest] = (offset, length)
+
+    @staticmethod
+    def digest(section: str, data: dict):
+        content = json.dumps(data, sort_keys=True, separators=(',', ':'),
+                             default=dict)
+        return hashlib.sha1(('%s\n%s' % (section, content)).encode()).digest()
+
+    def put(self, section: str, data: dict):
+        """ Store a record (once) and return its digest """
+        digest = self.digest(section, data)
+        with self._lock:
+            if digest not in self._objects:
+                content = zlib.compress(json.dumps(data,
+                                                   default=dict).encode())
+                self._pack.seek(0, os.SEEK_END)
+                offset = self._pack.tell()
+                self._pack.write(content)
+                self._pending.append(INDEX_RECORD.pack(digest, offset,
+                                                       len(content)))
+                self._objects[digest] = (offset, len(content))
+                if len(self._pending) >= 10000:
+                    self._flush()
+        return digest
+
+    def _flush(self):
+        # Objects are on disk before the index records pointing to them
+        self._pack.flush()
+        self._index.write(b''.join(self._pending))
+        self._index.flush()
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def get(self, digest: bytes):
+        """ Return a record from its digest """
+        with self._lock:
+            offset, length = self._objects[digest]
+            self._pack.flush()
+            self._pack.seek(offset)
+            content = self._pack.read(length)
+        return json.loads(zlib.decompress(content).decode())
+
+    def manifest(self, sid: str, date: str):
+        return os.path.join(self._path, MANIFESTS, sid,
+                            '%s.manifest.gz' % date)
+
+    def arrays(self):
+        return sorted(os.listdir(os.path.join(self._path, MANIFESTS)))
+
+    def dates(self, sid: str):
+        directory = os.path.join(self._path, MANIFESTS, sid)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name.split('.')[0] for name in os.listdir(directory)
+                      if name.endswith('.manifest.gz'))
+
+    def snapshot(self, sid: str, date: str = None):
+        """ Generator - (section, record) of a snapshot, in collection order
+
+        :param sid: SID of the array
+        :param date: date of the snapshot (YYYY-MM-DD), the latest one by
+                     default
+        """
+        if date is None:
+            dates = self.dates(sid)
+            if not dates:
+                msg = 'No snapshot of %s in the archive' % sid
+                self._logger.error(msg)
+                raise SnapshotArchiveError(msg)
+            date = dates[-1]
+
+        manifest = self.manifest(sid, date)
+        if not os.path.isfile(manifest):
+            msg = 'No snapshot of %s at %s in the archive' % (sid, date)
+            self._logger.error(msg)
+            raise SnapshotArchiveError(msg)
+
+        with gzip.open(manifest, 'rt') as manifest_file:
+            for line in manifest_file:
+                section, digest = line.split()
+                yield section, self.get(bytes.fromhex(digest))
+
+    def replay(self, sid: str, formatter: Formatter, date: str = None):
+        """ Send a snapshot to a formatter and close it
+
+        :param sid: SID of the array
+        :param formatter: Formatter receiving the records
+        :param date: date of the snapshot, the latest one by default
+        """
+        for section, record in self.snapshot(sid, date):
+            getattr(formatter, 'add_%s' % section)(record)
+        formatter.close()
+
+    def writer(self, sid: str, date: str = None):
+        """ Return a formatter storing an inventory as a new snapshot """
+        return ArchiveFormatter(self, sid, date)
+
+    def close(self):
+        self.flush()
+        self._pack.close()
+        self._index.close()
+
+
+class ArchiveFormatter(Formatter):
+    """ Store the data as a snapshot of a SnapshotArchive """
+
+    def __init__(self, archive: SnapshotArchive, sid: str, date: str = None):
+        """Constructor
+        :param archive: Archive receiving the snapshot
+        :param sid: SID of the array
+        :param date: Date of the snapshot (YYYY-MM-DD), today by default.
+                     An existing snapshot of the same date is replaced.
+        """
+        super().__init__()
+        self._archive = archive
+        date = date or time.strftime('%Y-%m-%d')
+        self._manifest = archive.manifest(sid, date)
+        os.makedirs(os.path.dirname(self._manifest), exist_ok=True)
+
+        # The manifest replaces the previous one only once complete
+        self._temporary = self._manifest + '.tmp'
+        self._file = gzip.open(self._temporary, 'wt')
+
+    def _add(self, section: str, data: dict):
+        digest = self._archive.put(section, data)
+        self._file.write('%s %s\n' % (section, digest.hex()))
+
+    def add_volume(self, vol_data):
+        self._add('volume', vol_data)
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._add('initiator_cascaded_group', init_data)
+
+    def add_storage_group(self, sg_data):
+        self._add('storage_group', sg_data)
+
+    def add_masking_view(self, view_data):
+        self._add('masking_view', view_data)
+
+    def add_initiator_group(self, init_data):
+        self._add('initiator_group', init_data)
+
+    def add_initiator(self, init_data):
+        self._add('initiator', init_data)
+
+    def add_srp(self, srp_data):
+        self._add('srp', srp_data)
+
+    def add_port_group(self, pg_data):
+        self._add('port_group', pg_data)
+
+    def add_array(self, array_data):
+        self._add('array', array_data)
+
+    def add_rollup(self, rollup_data):
+        self._add('rollup', rollup_data)
+
+    def add_forecast(self, forecast_data):
+        self._add('forecast', forecast_data)
+
+    def add_finding(self, finding_data):
+        self._add('finding', finding_data)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._archive.flush()
+        self._file.close()
+        os.replace(self._temporary, self._manifest)
+        self._file = None
@@ -2,9 +2,14 @@
 # coding: utf-8
 
 import logging
-from vmaxray.errors import VmaxInventoryFactoryError
+import queue
+import threading
+from vmaxray.errors import VmaxInventoryFactoryError, InventoryPipelineError
 from vmaxray.vmax_iterators import *
-from vmaxray.formatters import Formatter
+from vmaxray.formatters import Formatter, QueueFormatter
+from vmaxray.journal import InventoryJournal
+from vmaxray.models import SymbolTable
+from vmaxray.scope import Scope
 from vmaxray.PyU4V import RestFunctions
 
 
@@ -46,60 +51,204 @@ class VmaxInventoryCollector(object):
     def __init__(self):
         self._formatter = None
         self._array = None
+        self._symbols = None
+        self._journal = None
+        self._scope = None
+        self._shards = 0
+        self._prefetch = 0
+        self.counts = {}  # section -> number of objects collected
+        self.failed = {}  # section -> IDs of the objects that failed
         self._order = []  # have to be overload by the child
         self._logger = logging.getLogger('vmaxray')
 
+    def _get_section(self, section: str):
+        """ Send the objects of a section to the formatter
+
+        With a journal, the journaled objects are replayed first and only
+        the others are requested; the requested ones are journaled.
+        """
+        if not self._scope.includes(section):
+            self._logger.debug('  out of the scope (%s)' % self._scope)
+            return
+
+        add = getattr(self._formatter, 'add_%s' % section)
+        self.counts[section] = 0
+        if self._journal is None:
+            for data in self._fetch(section,
+                                    self._scope.ids(self._array, section)):
+                add(data)
+                self.counts[section] += 1
+            return
+
+        method, key_id, record = SOURCES[section]
+        journaled = set()
+        for data in self._journal.records(section):
+            data = record.from_json(data, self._symbols)
+            journaled.add(data[key_id])
+            add(data)
+            self.counts[section] += 1
+        if self._journal.complete(section):
+            return
+
+        try:
+            ids = (object_id for object_id
+                   in self._scope.ids(self._array, section)
+                   if object_id not in journaled)
+            for data in self._fetch(section, ids):
+                self._journal.add(section, data)
+                add(data)
+                self.counts[section] += 1
+        finally:
+            self._journal.commit()  # checkpoint, even on errors
+        self._journal.end_section(section)
+
+    def _fetch(self, section: str, ids):
+        """ Generator - records of a section from their IDs
+
+        The TDEVs are requested through several connections when sharded.
+        The objects whose request failed are kept in failed.
+        """
+        failed = self.failed.setdefault(section, [])
+        if section != 'volume' or self._shards < 2:
+            yield from fetch_records(self._array, section, ids, self._symbols,
+                                     prefetch=self._prefetch, failed=failed)
+            return
+
+        connections = [self._array.clone() for shard in range(self._shards)]
+        try:
+            yield from fetch_sharded(connections, section, ids,
+                                     self._symbols, prefetch=self._prefetch,
+                                     failed=failed)
+        finally:
+            for connection in connections:
+                connection.close_session()
+
     def _get_initiators(self):
         self._logger.info('- Extraction of initiators')
-        for initiator in InitiatorIterator(self._array):
-            self._formatter.add_initiator(initiator)
+        self._get_section('initiator')
 
     def _get_initiator_groups(self):
         self._logger.info('- Extraction of initiators groups')
-        for initiator in InitiatorGroupIterator(self._array):
-            self._formatter.add_initiator_group(initiator)
+        self._get_section('initiator_group')
 
     def _get_initiator_groups_cascaded(self):
         self._logger.info('- Extraction of cascaded initiators groups')
-        for initiator in InitiatorGroupCascadedIterator(self._array):
-            self._formatter.add_initiator_cascaded_group(initiator)
+        self._get_section('initiator_cascaded_group')
 
     def _get_port_groups(self):
         self._logger.info('- Extraction of port groups')
-        for port in PortGroupIterator(self._array):
-            self._formatter.add_port_group(port)
+        self._get_section('port_group')
 
     def _get_views(self):
         self._logger.info('- Extraction of masking views')
-        for view in MaskingViewGroupIterator(self._array):
-            self._formatter.add_masking_view(view)
+        self._get_section('masking_view')
 
     def _get_volumes(self):
         self._logger.info('- Extraction of TDEVs')
-        for volume in VolumesIterator(self._array):
-            self._formatter.add_volume(volume)
+        self._get_section('volume')
 
     def _get_srp(self):
         self._logger.info('- Extraction of SRPs')
-        for srp in SRPIterator(self._array):
-            self._formatter.add_srp(srp)
+        self._get_section('srp')
 
     def _get_storage_groups(self):
         self._logger.info('- Extraction of storage groups')
-        for sg in StorageGroupIterator(self._array):
-            self._formatter.add_storage_group(sg)
+        self._get_section('storage_group')
 
-    def collect(self, formatter: Formatter, array: RestFunctions):
+    def collect(self, formatter: Formatter, array: RestFunctions,
+                pipeline: int = 0, journal: InventoryJournal = None,
+                scope: Scope = None, shards: int = 0, prefetch: int = 0):
+        """ Inventory an array
+
+        :param formatter: Formatter receiving the objects
+        :param array: connection to the array
+        :param pipeline: size of the queue between the REST requests and the
+        formatter (0: the objects are written by the thread requesting them)
+        :param journal: journal checkpointing the collection, optional
+        :param scope: part of the array to inventory, the whole array if None
+        :param shards: number of connections requesting the TDEVs
+        :param prefetch: requests in flight per connection (0: one at a time)
+        """
         self._array = array
         self._formatter = formatter
+        self._journal = journal
+        self._scope = scope if scope is not None else Scope()
+        self._shards = shards
+        self._prefetch = prefetch
+        self.counts = {}
+        self.failed = {}
+        self._symbols = SymbolTable()  # shared values of the array
 
         self._logger.info('Beginning of data extraction (%s)' % self._array)
-        for collect_method in self._order:
-            collect_method()
+        if self._scope:
+            self._logger.info('Scope: %s' % self._scope)
+        if pipeline:
+            self._collect_pipelined(formatter, pipeline)
+        else:
+            for collect_method in self._order:
+                collect_method()
 
         self._logger.info('End of data extraction (%s)' % self._array)
+        self._logger.debug('%d shared values' % len(self._symbols))
         formatter.close()
 
+    def _collect_pipelined(self, formatter: Formatter, size: int):
+        """ Request the objects in a thread, write them in this one
+
+        The requesting thread is blocked while the queue is full, so no more
+        than size objects are waiting for the formatter. If the requests or
+        the formatter fail, the requesting thread is stopped, the objects
+        already collected are written and the formatter is closed before the
+        error is raised.
+        """
+        records = queue.Queue(maxsize=size)
+        stopped = threading.Event()
+        self._formatter = QueueFormatter(records, stopped)
+        errors = []
+
+        def fetch():
+            try:
+                for collect_method in self._order:
+                    collect_method()
+            except InventoryPipelineError:
+                pass  # stopped by the writer
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                try:
+                    self._formatter.close()
+                except InventoryPipelineError:
+                    pass
+
+        fetcher = threading.Thread(target=fetch, daemon=True,
+                                   name='vmaxray-fetch-%s' % self._array)
+        fetcher.start()
+        try:
+            for method, arguments in iter(records.get, None):
+                getattr(formatter, method)(*arguments)
+        except BaseException as error:
+            stopped.set()
+            try:
+                fetcher.join()
+            finally:
+                self._close_on_error(formatter, error)
+            raise
+        fetcher.join()
+
+        if errors:
+            self._logger.error('Extraction of %s interrupted, %s' %
+                               (self._array, errors[0]))
+            self._close_on_error(formatter, errors[0])
+            raise errors[0]
+
+    def _close_on_error(self, formatter: Formatter, error: BaseException):
+        """ Close the formatter after an error, that stays the one raised """
+        try:
+            formatter.close()
+        except Exception as close_error:
+            self._logger.error('Unable to close the inventory of %s after '
+                               '%r (%s)' % (self._array, error, close_error))
+
 
 class Vmax2InventoryCollector(VmaxInventoryCollector):
     """ Concrete class that define how to inventory an VMAX-2 array """
@@ -3,118 +3,359 @@
 
 import abc
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from vmaxray.errors import VmaxIteratorError
+from vmaxray.models import *
 from vmaxray.PyU4V.rest_univmax2 import RestFunctions
 
 __author__ = 'Julien B.'
 
+PREFETCH = 0  # details requested ahead of the consumer (0: one at a time)
+SHARD_SIZE = 100  # consecutive IDs requested by the same connection
+
+# Sections of an inventory -> (RestFunctions method, ID attribute, record)
+SOURCES = {'srp': ('get_srp', 'srpId', SRP),
+           'volume': ('get_volumes', 'volumeId', Volume),
+           'initiator': ('get_initiators', 'initiatorId', Initiator),
+           'masking_view': ('get_masking_views', 'maskingViewId',
+                            MaskingView),
+           'initiator_group': ('get_hosts', 'hostId', InitiatorGroup),
+           'initiator_cascaded_group': ('get_hostgroups', 'hostGroupId',
+                                        InitiatorGroupCascaded),
+           'port_group': ('get_portgroups', 'portGroupId', PortGroup),
+           'storage_group': ('get_sg', 'storageGroupId', StorageGroup)}
+
+
+def _check(result):
+    if result[1] != 200:
+        msg = 'Error while executing the request: %s' % str(result)
+        logging.getLogger('vmaxray').error(msg)
+        raise VmaxIteratorError(msg)
+
+
+def _items(items: list):
+    """ Generator - IDs of a list returned in one payload """
+    items = deque(items)
+    while items:
+        yield items.popleft()
+
+
+def _pages(vmax: RestFunctions, listing: dict):
+    """ Generator - volume IDs of a paginated list, page after page
+
+    Only the current page is kept in memory, the next one is requested
+    once it is consumed.
+    """
+    count = listing.get('count', 0)
+    page = listing.get('resultList', {})
+    while True:
+        for item in _items(page.get('result', [])):
+            yield item['volumeId']
+
+        end = page.get('to', count)
+        if 'id' not in listing or end >= count:
+            return
+        size = listing.get('maxPageSize', 1000)
+        result = vmax.get_iterator_page(listing['id'], end + 1,
+                                        min(end + size, count))
+        _check(result)
+        page = result[0]
+
+
+def _fetch(method, ids, record: type, symbols: SymbolTable, prefetch: int,
+           failed: list = None):
+    """ Generator - details of objects, in the order of their IDs
+
+    Up to prefetch requests are in flight while the consumer works on the
+    previous objects. Objects deleted since the listing are skipped, as the
+    objects whose request failed (their IDs are added to failed).
+    """
+    def parse(object_id, result):
+        data = result[0]
+        if data is None:
+            logging.getLogger('vmaxray').warning(
+                'Unable to get %s (%s)' % (object_id, result[1]))
+            if failed is not None and result[1] != 404:
+                failed.append(object_id)
+        elif record is not None:
+            data = record.from_json(data, symbols)
+        return data
+
+    if prefetch < 1:
+        for object_id in ids:
+            data = parse(object_id, method(object_id))
+            if data is not None:
+                yield data
+        return
+
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        pending = deque()
+        for object_id in ids:
+            pending.append((object_id, pool.submit(method, object_id)))
+            if len(pending) < prefetch:
+                continue
+            object_id, future = pending.popleft()
+            data = parse(object_id, future.result())
+            if data is not None:
+                yield data
+
+        while pending:
+            object_id, future = pending.popleft()
+            data = parse(object_id, future.result())
+            if data is not None:
+                yield data
+
+
+def list_ids(vmax: RestFunctions, section: str, filters: dict = None):
+    """ Request the list of the objects of a section
+
+    The list is requested right away (VmaxIteratorError on failure), the
+    pages of the volumes are then requested as they are consumed.
+    :param vmax: connection to the array
+    :param section: name of the section (volume, storage_group...)
+    :param filters: Unisphere query filters, optional
+    :return: generator of the IDs
+    """
+    method, key_id, record = SOURCES[section]
+    method = getattr(vmax, method)
+    if section == 'volume':
+        filters = dict(filters or {}, tdev=True)
+    result = method(filters=filters) if filters else method()
+    _check(result)
+
+    if section == 'volume':
+        return _pages(vmax, result[0] or {})
+    return _items(result[0][key_id] if result[0] else [])
+
+
+def fetch_records(vmax: RestFunctions, section: str, ids,
+                  symbols: SymbolTable = None, prefetch: int = PREFETCH,
+                  failed: list = None):
+    """ Generator - records of objects of a section from their IDs
+
+    :param vmax: connection to the array
+    :param section: name of the section (volume, storage_group...)
+    :param ids: iterable of IDs
+    :param symbols: symbol table of the array, optional
+    :param prefetch: number of requests in flight (0 to disable)
+    :param failed: list receiving the IDs whose request failed, optional
+    """
+    method, key_id, record = SOURCES[section]
+    return _fetch(getattr(vmax, method), ids, record, symbols, prefetch,
+                  failed)
+
+
+def fetch_sharded(connections: list, section: str, ids,
+                  symbols: SymbolTable = None, prefetch: int = PREFETCH,
+                  shard_size: int = SHARD_SIZE, failed: list = None):
+    """ Generator - records of objects of a section, requested by several
+    connections at once
+
+    The IDs are split into shards of shard_size consecutive IDs. Each
+    connection has its own worker thread, taking the next shard once it is
+    done with the previous one; the records are yielded shard after shard,
+    in the order of the IDs. The workers stay at most two shards each ahead
+    of the consumer. An error of a worker is raised when its shard is
+    reached.
+    :param connections: connections to the array (RestFunctions.clone)
+    :param section: name of the section (volume, storage_group...)
+    :param ids: iterable of IDs
+    :param symbols: symbol table of the array, optional
+    :param prefetch: number of requests in flight per connection
+    :param shard_size: number of IDs per shard
+    :param failed: list receiving the IDs whose request failed, optional
+    """
+    method, key_id, record = SOURCES[section]
+    ids = iter(ids)
+    window = 2 * len(connections)
+    condition = threading.Condition()
+    results = {}  # shard -> records, or the error of the worker
+    state = {'next': 0, 'consumed': 0, 'exhausted': False, 'stopped': False}
+
+    def work(vmax: RestFunctions):
+        get = getattr(vmax, method)
+        while True:
+            with condition:
+                while not state['stopped'] and \
+                        state['next'] - state['consumed'] >= window:
+                    condition.wait()
+                if state['stopped'] or state['exhausted']:
+                    return
+                shard = state['next']
+                state['next'] += 1
+                try:
+                    shard_ids = list(islice(ids, shard_size))
+                except BaseException as error:  # listing failed
+                    shard_ids, results[shard] = [], error
+                if not shard_ids:
+                    state['exhausted'] = True
+                    condition.notify_all()
+                    return
+
+            try:
+                records = list(_fetch(get, shard_ids, record, symbols,
+                                      prefetch, failed))
+            except BaseException as error:
+                records = error
+            with condition:
+                results[shard] = records
+                condition.notify_all()
+
+    workers = [threading.Thread(target=work, args=(vmax,), daemon=True,
+                                name='vmaxray-shard-%d' % number)
+               for number, vmax in enumerate(connections)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        shard = 0
+        while True:
+            with condition:
+                while shard not in results and not (
+                        state['exhausted'] and shard >= state['next'] - 1):
+                    condition.wait()
+                if shard not in results:
+                    return
+                records = results.pop(shard)
+                state['consumed'] = shard + 1
+                condition.notify_all()
+            if isinstance(records, BaseException):
+                raise records
+            yield from records
+            shard += 1
+    finally:
+        with condition:
+            state['stopped'] = True
+            condition.notify_all()
+        for worker in workers:
+            worker.join()
+
+
+def stream_records(vmax: RestFunctions, section: str,
+                   symbols: SymbolTable = None, prefetch: int = PREFETCH,
+                   filters: dict = None):
+    """ Stream the records of a section, without keeping them
+
+    :return: generator of records (vmaxray.models)
+    """
+    return fetch_records(vmax, section, list_ids(vmax, section, filters),
+                         symbols, prefetch)
+
+
+def stream_inventory(vmax: RestFunctions, sections: list = None,
+                     symbols: SymbolTable = None, prefetch: int = PREFETCH):
+    """ Generator - (section, record) of a whole array, section by section
+
+    :param vmax: connection to the array
+    :param sections: sections to stream, all of them by default
+    :param symbols: symbol table of the array, a new one by default
+    :param prefetch: number of requests in flight (0 to disable)
+    """
+    symbols = SymbolTable() if symbols is None else symbols
+    for section in sections or SOURCES:
+        for record in stream_records(vmax, section, symbols, prefetch):
+            yield section, record
+
 
 class VmaxObjectIterator(object, metaclass=abc.ABCMeta):
     """ Abstract class for all iterator's """
 
-    def __init__(self, method: RestFunctions, key_id: str, key_group: str):
+    def __init__(self, method: RestFunctions, key_id: str, key_group: str,
+                 record: type = None, symbols: SymbolTable = None,
+                 prefetch: int = PREFETCH):
         """Constructor
 
         :param method: method used by the iterator to extract data
         :param key_id: what group of data to extract
         :param key_group: what attribute is used to describe the data
+        :param record: Record class of the objects (raw dicts if None)
+        :param symbols: symbol table of the array, optional
+        :param prefetch: number of requests in flight (0 to disable)
         """
 
         self._logger = logging.getLogger('vmaxray')
-        self._get_method = method  # Method used for collecting items
-        result = self._get_method()  # First extract (for testing response)
-
-        if result[1] != 200:
-            msg = 'Error while executing the request: %s' % str(result)
-            self._logger.error(msg)
-            raise VmaxIteratorError
+        result = method()  # First extract (for testing response)
+        _check(result)
 
-        # List of groups to audit later
-        self._items = result[0][key_id] if result[0] else []
         self._key_group = key_group  # Key used for filtering
+        ids = _items(result[0][key_id] if result[0] else [])
+        self._records = _fetch(method, ids, record, symbols, prefetch)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        try:
-            one_item = self._items.pop(0)
-        except IndexError:
-            raise StopIteration
-
-        return self._get_method(one_item)[0]
+        return next(self._records)
 
 
 class StorageGroupIterator(VmaxObjectIterator):
     """ Storage Group iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_sg, 'storageGroupId', 'storageGroup')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_sg, 'storageGroupId', 'storageGroup',
+                         StorageGroup, symbols)
 
 
 class PortGroupIterator(VmaxObjectIterator):
     """ PortGroup iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_portgroups, 'portGroupId', 'portGroup')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_portgroups, 'portGroupId', 'portGroup',
+                         PortGroup, symbols)
 
 
 class MaskingViewGroupIterator(VmaxObjectIterator):
     """ Masking View iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_masking_views, 'maskingViewId', 'maskingView')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_masking_views, 'maskingViewId',
+                         'maskingView', MaskingView, symbols)
 
 
 class InitiatorIterator(VmaxObjectIterator):
     """ Initiators iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_initiators, 'initiatorId', 'initiator')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_initiators, 'initiatorId', 'initiator',
+                         Initiator, symbols)
 
 
 class InitiatorGroupIterator(VmaxObjectIterator):
     """ Initiator Group iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_hosts, 'hostId', 'host')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_hosts, 'hostId', 'host',
+                         InitiatorGroup, symbols)
 
 
 class InitiatorGroupCascadedIterator(VmaxObjectIterator):
     """ Initiator Group Cascaded iterator"""
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_hostgroups, 'hostGroupId', 'hostGroup')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_hostgroups, 'hostGroupId', 'hostGroup',
+                         InitiatorGroupCascaded, symbols)
 
 
 class SRPIterator(VmaxObjectIterator):
     """ SRP iterator """
-    def __init__(self, vmax: RestFunctions):
-        super().__init__(vmax.get_srp, 'srpId', 'srp')
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None):
+        super().__init__(vmax.get_srp, 'srpId', 'srp', SRP, symbols)
 
 
 class VolumesIterator(object):
     """ Volume iterator """
-    def __init__(self, vmax: RestFunctions):
+    def __init__(self, vmax: RestFunctions, symbols: SymbolTable = None,
+                 prefetch: int = PREFETCH):
         """Constructor
 
-        :param method: method used by the iterator to extract data
-        :param key_id: what group of data to extract
-        :param key_group: what attribute is used to describe the data
+        :param vmax: connection to the array
+        :param symbols: symbol table of the array, optional
+        :param prefetch: number of requests in flight (0 to disable)
         """
         self._logger = logging.getLogger('vmaxray')
-        self._get_method = vmax.get_volumes  # Method used for collecting items
-        result = self._get_method(filters={'tdev': True})  # First extract (for testing response)
-
-        if result[1] != 200:
-            msg = 'Error while executing the request: %s' % str(result)
-            self._logger.error(msg)
-            raise VmaxIteratorError
-
-        self._items = result[0]['resultList']['result']  # List of groups to audit later
         self._key_group = 'volumeId'  # Key used for filtering
+        # The first page is requested right away (for testing response)
+        self._records = stream_records(vmax, 'volume', symbols, prefetch)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        try:
-            one_item = self._items.pop(0)
-        except IndexError:
-            raise StopIteration
-
-        return self._get_method(one_item['volumeId'])[0]
+        return next(self._records)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from array import array
+from vmaxray.errors import WwnIndexError
+from vmaxray.formatters import Formatter
+
+__author__ = 'Julien B.'
+
+MAGIC = b'VXWWNIX1'
+HEADER = struct.Struct('<8sQQ')  # magic, number of entries, offsets position
+
+# Director and port prefixing the WWN of an initiator (FA-1D:4:10000000c9...)
+DIRECTOR_PORT = re.compile(r'^[A-Z]{2}-\d+[A-Z]:\d+:')
+HEXADECIMAL = re.compile(r'^[0-9A-Fa-f:]+$')
+
+
+def normalize(value: str):
+    """ Key of a WWN: uppercase, without director prefix nor colons
+
+    Other identifiers (iSCSI names...) are only uppercased.
+    """
+    value = DIRECTOR_PORT.sub('', value.strip())
+    if HEXADECIMAL.match(value):
+        value = value.replace(':', '')
+    return value.upper()
+
+
+class WwnIndexWriter(object):
+    """ Build the WWN index of a fleet of arrays
+
+    Each array is joined (volume -> SGs -> MVs -> hosts, initiator -> MVs
+    -> SGs) once its inventory is complete, and its entries are written as
+    a sorted run in a temporary file. Closing the writer merges the runs
+    into the index file:
+    - a header (magic, number of entries, position of the offsets)
+    - the entries, one 'KEY<TAB>JSON' line each, sorted by key
+    - the offsets of the entries (uint64 little endian)
+    """
+
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: index file (replaced once the index is complete)
+        """
+        self._logger = logging.getLogger('vmaxray')
+        self._path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+            self._logger.error('Unable to write the index %s' % path)
+            raise WwnIndexError('Unable to write the index %s' % path)
+        self._directory = tempfile.TemporaryDirectory(dir=directory)
+        self._runs = []
+
+    def formatter(self, sid: str):
+        """ Return a formatter adding the inventory of an array """
+        return WwnIndexFormatter(self, sid)
+
+    def add_array(self, sid: str, volumes: list, initiators: list,
+                  views: dict, host_groups: dict):
+        """ Join the objects of an array and write its entries
+
+        :param sid: SID of the array
+        :param volumes: (volumeId, WWNs, SGs) tuples
+        :param initiators: (initiatorId, alias, IG, MVs) tuples
+        :param views: MV -> (SG, host or cascaded IG)
+        :param host_groups: cascaded IG -> IGs
+        """
+        sg_views = {}
+        for view, (sg, host) in views.items():
+            sg_views.setdefault(sg, []).append(view)
+
+        entries = []
+        for volume, wwns, sgs in volumes:
+            mvs = sorted({view for sg in sgs for view in sg_views.get(sg, [])})
+            entry = json.dumps({'sid': sid, 'type': 'volume',
+                                'object': volume, 'storage_groups': sgs,
+                                'masking_views': mvs,
+                                'hosts': self._hosts(mvs, views,
+                                                     host_groups)})
+            entries.extend((wwn, entry) for wwn in wwns)
+
+        for initiator, alias, host, mvs in initiators:
+            entry = json.dumps({'sid': sid, 'type': 'initiator',
+                                'object': initiator, 'alias': alias,
+                                'storage_groups': sorted(
+                                    {views[view][0] for view in mvs
+                                     if view in views}),
+                                'masking_views': mvs,
+                                'hosts': [host] if host else []})
+            entries.append((normalize(initiator), entry))
+
+        entries.sort()
+        run = tempfile.NamedTemporaryFile('w', dir=self._directory.name,
+                                          delete=False)
+        with run:
+            run.writelines('%s\t%s\n' % entry for entry in entries)
+        self._runs.append(run.name)
+        self._logger.debug('%d WWNs indexed for %s' % (len(entries), sid))
+
+    @staticmethod
+    def _hosts(mvs: list, views: dict, host_groups: dict):
+        hosts = set()
+        for view in mvs:
+            host = views[view][1]
+            if host:
+                hosts.add(host)
+                hosts.update(host_groups.get(host, []))
+        return sorted(hosts)
+
+    def close(self):
+        """ Merge the runs into the index file """
+        temporary = self._path + '.tmp'
+        offsets = array('Q')
+        runs = [open(run) for run in self._runs]
+        with open(temporary, 'wb') as index:
+            index.write(HEADER.pack(MAGIC, 0, 0))
+            for line in heapq.merge(*runs):
+                offsets.append(index.tell())
+                index.write(line.encode())
+            position = index.tell()
+            if sys.byteorder != 'little':
+                offsets.byteswap()
+            index.write(offsets.tobytes())
+            index.seek(0)
+            index.write(HEADER.pack(MAGIC, len(offsets), position))
+
+        for run in runs:
+            run.close()
+        os.replace(temporary, self._path)
+        self._directory.cleanup()
+        self._logger.info('%d WWNs in the index %s' %
+                          (len(offsets), self._path))
+
+
+class WwnIndexFormatter(Formatter):
+    """ Keep what the WWN index needs from the inventory of an array """
+
+    def __init__(self, writer: WwnIndexWriter, sid: str):
+        """Constructor
+        :param writer: Index receiving the array once its inventory is done
+        :param sid: SID of the array
+        """
+        super().__init__()
+        self._writer = writer
+        self._sid = sid
+        self._volumes = []
+        self._initiators = []
+        self._views = {}
+        self._host_groups = {}
+
+    def add_volume(self, vol_data):
+        wwns = {normalize(vol_data[attribute])
+                for attribute in ('wwn', 'effective_wwn')
+                if vol_data.get(attribute)}
+        if wwns:
+            self._volumes.append((vol_data['volumeId'], sorted(wwns),
+                                  vol_data.get('storageGroupId') or []))
+
+    def add_initiator(self, init_data):
+        self._initiators.append((init_data['initiatorId'],
+                                 init_data.get('alias'),
+                                 init_data.get('host'),
+                                 init_data.get('maskingview') or []))
+
+    def add_masking_view(self, view_data):
+        self._views[view_data['maskingViewId']] = (
+            view_data.get('storageGroupId'),
+            view_data.get('hostId') or view_data.get('hostGroupId'))
+
+    def add_initiator_cascaded_group(self, init_data):
+        self._host_groups[init_data['hostGroupId']] = [
+            host['hostId'] if isinstance(host, dict) else host
+            for host in init_data.get('host') or []]
+
+    def add_initiator_group(self, init_data):
+        pass
+
+    def add_port_group(self, pg_data):
+        pass
+
+    def add_storage_group(self, sg_data):
+        pass
+
+    def add_srp(self, srp_data):
+        pass
+
+    def close(self):
+        if self._volumes is None:
+            return
+        self._writer.add_array(self._sid, self._volumes, self._initiators,
+                               self._views, self._host_groups)
+        self._volumes = None
+
+
+class WwnIndex(object):
+    """ Look up WWNs in an index written by WwnIndexWriter
+
+    The file is memory-mapped: a lookup is a binary search over the
+    offsets of the entries, only the probed keys are read.
+    """
+
+    def __init__(self, path: str):
+        """Constructor
+
+        :param path: index file
+        """
+        self._logger = logging.getLogger('vmaxray')
+        try:
+            with open(path, 'rb') as index:
+                self._map = mmap.mmap(index.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            magic, self._count, position = HEADER.unpack_from(self._map)
+        except (OSError, ValueError, struct.error):
+            self._logger.error('Unable to read the index %s' % path)
+            raise WwnIndexError('Unable to read the index %s' % path)
+        if magic != MAGIC:
+            self._logger.error('Invalid index %s' % path)
+            raise WwnIndexError('Invalid index %s' % path)
+
+        self._position = position
+        if sys.byteorder == 'little':
+            self._offsets = memoryview(self._map)[
+                position:position + 8 * self._count].cast('Q')
+        else:
+            self._offsets = array('Q')
+            self._offsets.frombytes(
+                self._map[position:position + 8 * self._count])
+            self._offsets.byteswap()
+
+    def __len__(self):
+        return self._count
+
+    def _key(self, rank: int):
+        offset = self._offsets[rank]
+        return self._map[offset:self._map.find(b'\t', offset)].decode()
+
+    def lookup(self, wwn: str):
+        """ Return the entries of a WWN (one per array it is seen on) """
+        key = normalize(wwn)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        while low < self._count and self._key(low) == key:
+            offset = self._offsets[low]
+            end = (self._offsets[low + 1] if low + 1 < self._count
+                   else self._position)
+            line = self._map[offset:end].decode()
+            entries.append(json.loads(line.split('\t', 1)[1]))
+            low += 1
+        return entries
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._map.close()
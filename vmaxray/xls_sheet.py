@@ -2,17 +2,25 @@
 # coding: utf-8
 
 import logging
-from copy import deepcopy
 from xlsxwriter import workbook, worksheet
 
 
 class Singleton(type):
+    """ One instance of a sheet per workbook """
     _instances = {}
 
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+    def __call__(cls, book, *args, **kwargs):
+        key = (cls, book)
+        if key not in cls._instances:
+            cls._instances[key] = super(Singleton, cls).__call__(book, *args,
+                                                                 **kwargs)
+        return cls._instances[key]
+
+    @classmethod
+    def release(mcs, book):
+        """ Forget the sheets of a closed workbook """
+        for key in [key for key in list(mcs._instances) if key[1] is book]:
+            del mcs._instances[key]
 
 
 class AbstractSheet(object):
@@ -136,10 +144,9 @@ class InitiatorGroupCascadedSheet(AbstractSheet, metaclass=Singleton):
     def add_row(self, **data):
         """ Clean the data before call the abstract method """
         if 'host' in data:
-            ig_data = deepcopy(data)
-            key = 'host'
-            ig_data[key] = [i['hostId'] for i in data[key]]
-            super().add_row(**ig_data)
+            # data is already a copy of the record, only the list is rebuilt
+            data['host'] = [i['hostId'] for i in data['host']]
+            super().add_row(**data)
 
 
 class MaskingViewSheet(AbstractSheet, metaclass=Singleton):
@@ -178,10 +185,10 @@ class PortGroupSheet(AbstractSheet, metaclass=Singleton):
     def add_row(self, **data):
         """ Clean the data before call the abstract method """
         if 'symmetrixPortKey' in data:
-            pg_data = deepcopy(data)
-            key = 'symmetrixPortKey'
-            pg_data[key] = [':'.join(list(i.values())) for i in data[key]]
-            super().add_row(**pg_data)
+            # data is already a copy of the record, only the list is rebuilt
+            data['symmetrixPortKey'] = [':'.join(list(i.values()))
+                                        for i in data['symmetrixPortKey']]
+            super().add_row(**data)
 
 
 class SRPSheet(AbstractSheet, metaclass=Singleton):
@@ -315,3 +322,71 @@ class VmaxSheet(AbstractSheet, metaclass=Singleton):
                             'device_count': 20}
 
         self._initialize_sheet()
+
+
+class RollupSheet(AbstractSheet, metaclass=Singleton):
+
+    def __init__(self, book):
+        super().__init__(book, sheet_name='Performance Rollup')
+        self._mapping = {'group': 0,
+                         'date': 1,
+                         'metric': 2,
+                         'aggregate': 3,
+                         'value': 4,
+                         'samples': 5}
+
+        self._cells_size = {'group': 30,
+                            'date': 20,
+                            'metric': 30,
+                            'aggregate': 12,
+                            'value': 15,
+                            'samples': 12}
+        self._initialize_sheet()
+
+
+class ForecastSheet(AbstractSheet, metaclass=Singleton):
+
+    def __init__(self, book):
+        super().__init__(book, sheet_name='Capacity Forecast')
+        self._mapping = {'sid': 0,
+                         'section': 1,
+                         'object': 2,
+                         'metric': 3,
+                         'samples': 4,
+                         'last_value': 5,
+                         'growth_per_day': 6,
+                         'capacity': 7,
+                         'threshold': 8,
+                         'days_left': 9,
+                         'date': 10}
+
+        self._cells_size = {'sid': 15,
+                            'section': 15,
+                            'object': 30,
+                            'metric': 25,
+                            'samples': 10,
+                            'last_value': 15,
+                            'growth_per_day': 15,
+                            'capacity': 15,
+                            'threshold': 12,
+                            'days_left': 12,
+                            'date': 15}
+        self._initialize_sheet()
+
+
+class AuditSheet(AbstractSheet, metaclass=Singleton):
+
+    def __init__(self, book):
+        super().__init__(book, sheet_name='Audit')
+        self._mapping = {'sid': 0,
+                         'check': 1,
+                         'section': 2,
+                         'object': 3,
+                         'detail': 4}
+
+        self._cells_size = {'sid': 15,
+                            'check': 30,
+                            'section': 25,
+                            'object': 40,
+                            'detail': 60}
+        self._initialize_sheet()